@@ -0,0 +1,104 @@
+from pandas import DataFrame, factorize
+from numpy import ndarray, zeros, bincount, arange
+from typing import Dict, List
+
+
+# Bit of each binary answer in `binary_answers_mask`, same order as `binary_qs_variables_name` in the pipeline.
+binary_answers_bits = {
+    "crop_production": 0,
+    "processing_of_agricultural_products": 1,
+    "irrigation_practice_on_household_farm": 2,
+    "use_of_mineral_fertilizers_by_men": 3,
+    "use_of_mineral_fertilizers_by_women": 4,
+    "use_of_organic_fertilizers_by_men": 5,
+    "use_of_organic_fertilizers_by_women": 6
+}
+binary_answers_labels = {
+    "crop_production": "Crop production",
+    "processing_of_agricultural_products": "Processing of agricultural products",
+    "irrigation_practice_on_household_farm": "Irrigation practice",
+    "use_of_mineral_fertilizers_by_men": "Mineral fertilizers by men",
+    "use_of_mineral_fertilizers_by_women": "Mineral fertilizers by women",
+    "use_of_organic_fertilizers_by_men": "Organic fertilizers by men",
+    "use_of_organic_fertilizers_by_women": "Organic fertilizers by women"
+}
+n_mask_values = 1 << len(binary_answers_bits)
+
+
+def binary_answers_mask(data:DataFrame) -> ndarray:
+    """
+    `binary_answers_mask` column saved by the pipeline, packed from the answer columns for
+    databases saved before it existed.
+    """
+    if "binary_answers_mask" in data.columns:
+        return data["binary_answers_mask"].to_numpy().astype("int64")
+
+    mask = zeros(data.shape[0], dtype="int64")
+    for binary_variable, bit in binary_answers_bits.items():
+        mask |= (data[binary_variable].to_numpy() == 1).astype("int64") << bit
+    return mask
+
+
+def build_binary_answers_histogram(data:DataFrame) -> Dict[bool, Dict]:
+    """
+    Number of households of each department for each of the 128 answer combinations, built once
+    per dataset. Counting any combination then sums at most 128 cells per department instead of
+    scanning the households.
+    """
+    try:
+        codes, departments = factorize(data["department"])
+        mask = binary_answers_mask(data)
+        keep = codes >= 0
+
+        counts = bincount(
+            codes[keep] * n_mask_values + mask[keep],
+            minlength=len(departments) * n_mask_values
+        ).reshape(len(departments), n_mask_values)
+        return {"error": False, "value": {"departments": list(departments), "counts": counts}}
+    except ValueError as e:
+        print(e)
+        return {"error": True, "value": None}
+
+
+def count_households_with_answers(
+        histogram:Dict,
+        answers:List[str],
+        match:str="all",
+        department_name:str=None
+) -> Dict[bool, DataFrame]:
+    """
+    Households of each department that answered "yes" to `answers`: to all of them ("all"), at
+    least one ("any") or none ("none"). For example ["irrigation_practice_on_household_farm",
+    "use_of_organic_fertilizers_by_women"] counts households that irrigate and whose women use
+    organic fertilizer.
+    """
+    if match not in ["all", "any", "none"]:
+        raise ValueError("`match` must be any of ['all', 'any', 'none']")
+
+    try:
+        query_mask = 0
+        for answer in answers:
+            query_mask |= 1 << binary_answers_bits[answer]
+
+        mask_values = arange(n_mask_values)
+        if match == "all":
+            selected = (mask_values & query_mask) == query_mask
+        elif match == "any":
+            selected = (mask_values & query_mask) != 0
+        else:
+            selected = (mask_values & query_mask) == 0
+
+        households = histogram["counts"][:, selected].sum(axis=1)
+        totals = histogram["counts"].sum(axis=1)
+        func_df = DataFrame({
+            "department": histogram["departments"],
+            "households": households,
+            "percentage": (households / totals * 100).round(1)
+        })
+
+        if department_name is not None:
+            func_df = func_df.loc[func_df["department"] == department_name]
+        return {"error": False, "data": func_df}
+    except (ValueError, KeyError) as e:
+        print(e)
+        return {"error": True, "data": None}
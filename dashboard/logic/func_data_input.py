@@ -1,9 +1,52 @@
-from pandas import DataFrame
+from pandas import DataFrame, factorize
+from numpy import bincount
+from typing import Dict
 
-def get_unique_values_list(data:DataFrame, value_type:str, by_var:str=None, by_value:str=None):
-    """ """
+
+def build_department_index(data:DataFrame) -> Dict[bool, Dict]:
+    """
+    Department index of `data`, built once per dataset. Only the row positions stably sorted by
+    department are kept, not a sorted copy of `data`, so each department is a contiguous slice of
+    `order` and is taken from `data` when needed. The household ids of each department are kept
+    as a list. Departments are listed in order of first appearance, like `unique()`.
+    """
+    try:
+        codes, departments = factorize(data["department"])
+        order = codes.argsort(kind="stable")
+
+        # Rows without a department sort first and are left out of every slice.
+        counts = bincount(codes[codes >= 0], minlength=len(departments))
+        stops = counts.cumsum() + (codes < 0).sum()
+        starts = stops - counts
+
+        slices = {department: slice(start, stop) for department, start, stop in zip(departments, starts, stops)}
+        households = {
+            department: list(data["household_id"].take(order[department_slice]).unique())
+            for department, department_slice in slices.items()
+        }
+        index = {"order": order, "departments": list(departments), "slices": slices, "households": households}
+        return {"error": False, "value": index}
+    except ValueError as e:
+        print(e)
+        return {"error": True, "value": None}
+
+
+def get_unique_values_list(
+        data:DataFrame,
+        value_type:str,
+        by_var:str=None,
+        by_value:str=None,
+        department_index:Dict=None
+):
+    """
+    Departments, or households of a department, are read from `department_index` when given.
+    """
     try:
-        if by_var is None:
+        if department_index is not None and value_type == "department" and by_var is None:
+            val = department_index["departments"]
+        elif department_index is not None and value_type == "household_id" and by_var == "department":
+            val = department_index["households"].get(by_value, [])
+        elif by_var is None:
             val = list(data[value_type].unique())
         else:
             if by_value is not None:
@@ -11,4 +54,4 @@ def get_unique_values_list(data:DataFrame, value_type:str, by_var:str=None, by_v
         return {"error": False, "value": val}
     except ValueError as e:
         print(e)
-        return {"error": True, "value": None}
\ No newline at end of file
+        return {"error": True, "value": None}
@@ -0,0 +1,154 @@
+from pandas import DataFrame
+from pandas.util import hash_pandas_object
+from prophet import Prophet
+from prophet.serialize import model_to_json, model_from_json
+from collections import OrderedDict
+from hashlib import blake2b
+from threading import Lock
+from pathlib import Path
+from os import makedirs, replace, getpid
+from typing import Dict
+import json
+
+
+# Fitted models are kept in memory (least recently used evicted first) and saved to
+# `model_cache_dir`, so they survive restarts and are shared by every worker.
+model_cache_dir = Path(__file__).parent.parent / "db" / "prophet_models"
+memory_cache_size = 32
+
+memory_model_cache = OrderedDict()
+model_cache_lock = Lock()
+
+# Forecasts computed for all departments at once, kept in memory only.
+memory_forecast_cache = OrderedDict()
+
+
+def rainfall_series_hash(fct_df:DataFrame) -> str:
+    """
+    Hash of the "ds" and "y" values the model is fitted on.
+    """
+    row_hashes = hash_pandas_object(fct_df[["ds", "y"]], index=False).to_numpy()
+    return blake2b(row_hashes.tobytes(), digest_size=16).hexdigest()
+
+
+def rainfall_data_hash(rainfall_data:DataFrame) -> str:
+    """
+    Hash of the rainfall of every department.
+    """
+    row_hashes = hash_pandas_object(rainfall_data[["department", "date", "rainfall_qty"]], index=False).to_numpy()
+    return blake2b(row_hashes.tobytes(), digest_size=16).hexdigest()
+
+
+def remember_forecast(key:str, forecast:DataFrame):
+    """ """
+    with model_cache_lock:
+        memory_forecast_cache[key] = forecast
+        memory_forecast_cache.move_to_end(key)
+        while len(memory_forecast_cache) > memory_cache_size:
+            memory_forecast_cache.popitem(last=False)
+
+
+def load_cached_forecast(key:str) -> DataFrame:
+    """
+    Forecast remembered under `key`, None when it was never computed.
+    """
+    with model_cache_lock:
+        if key not in memory_forecast_cache:
+            return None
+        memory_forecast_cache.move_to_end(key)
+        return memory_forecast_cache[key]
+
+
+def model_cache_key(department:str, series_hash:str, model_settings:Dict) -> str:
+    """
+    The forecast horizon is not part of the key, the same fitted model predicts any horizon.
+    """
+    payload = json.dumps({"department": department, "series_hash": series_hash, "settings": model_settings}, sort_keys=True)
+    return blake2b(payload.encode(), digest_size=16).hexdigest()
+
+
+def remember_model(key:str, model:Prophet):
+    """ """
+    with model_cache_lock:
+        memory_model_cache[key] = model
+        memory_model_cache.move_to_end(key)
+        while len(memory_model_cache) > memory_cache_size:
+            memory_model_cache.popitem(last=False)
+
+
+def load_cached_model(key:str) -> Prophet:
+    """
+    Fitted model of `key` from memory, or from disk, None when it was never fitted.
+    """
+    with model_cache_lock:
+        if key in memory_model_cache:
+            memory_model_cache.move_to_end(key)
+            return memory_model_cache[key]
+
+    model_path = model_cache_dir / f"{key}.json"
+    if not model_path.exists():
+        return None
+
+    try:
+        with open(model_path) as model_file:
+            model = model_from_json(model_file.read())
+    except (ValueError, KeyError) as e:
+        print(f"Ignoring unreadable cached model {model_path}: {e}")
+        return None
+
+    remember_model(key, model)
+    return model
+
+
+def save_cached_model(key:str, model:Prophet):
+    """
+    Keep `model` in memory and save it to disk. The file is written under a temporary name and
+    renamed so other workers never read a half-written model.
+    """
+    remember_model(key, model)
+
+    makedirs(model_cache_dir, exist_ok=True)
+    model_path = model_cache_dir / f"{key}.json"
+    tmp_path = model_cache_dir / f"{key}.{getpid()}.tmp"
+    with open(tmp_path, "w") as model_file:
+        model_file.write(model_to_json(model))
+    replace(tmp_path, model_path)
+
+
+def warm_start_params(model:Prophet) -> Dict:
+    """
+    Fitted parameters of `model` in the form `Prophet.fit(init=...)` takes, to start a new fit
+    from them instead of from scratch.
+    """
+    return {
+        "k": model.params["k"][0][0],
+        "m": model.params["m"][0][0],
+        "sigma_obs": model.params["sigma_obs"][0][0],
+        "delta": model.params["delta"][0],
+        "beta": model.params["beta"][0]
+    }
+
+
+def fit_or_load_prophet_model(
+        fct_df:DataFrame,
+        department:str,
+        model_settings:Dict,
+        warm_start_model:Prophet=None
+) -> Prophet:
+    """
+    Prophet model fitted on `fct_df`, only fitted when no model with the same department, data
+    and settings is cached. The fit starts from the parameters of `warm_start_model` when given,
+    e.g. the model of the same department before new months were appended.
+    """
+    key = model_cache_key(department, rainfall_series_hash(fct_df), model_settings)
+
+    model = load_cached_model(key)
+    if model is None:
+        model = Prophet(**model_settings)
+        if warm_start_model is None:
+            model.fit(fct_df)
+        else:
+            model.fit(fct_df, init=warm_start_params(warm_start_model))
+        save_cached_model(key, model)
+
+    return model
@@ -13,10 +13,17 @@ from typing import Dict, List, Tuple
 
 
 
-def filter_department(df:DataFrame, department_name:str) -> Dict[bool, DataFrame]:
-    """ """
+def filter_department(df:DataFrame, department_name:str, department_index:Dict=None) -> Dict[bool, DataFrame]:
+    """ 
+    With a `department_index` built by `build_department_index` on `df` the rows are taken
+    instead of scanned.
+    """
     try:
-        filt_df =  df.loc[df["department"] == department_name]
+        if department_index is not None:
+            department_slice = department_index["slices"].get(department_name, slice(0, 0))
+            filt_df = df.take(department_index["order"][department_slice])
+        else:
+            filt_df =  df.loc[df["department"] == department_name]
         return {"error": False, "data": filt_df}
     except ValueError as e:
         print(e)
@@ -84,9 +91,9 @@ def crop_department_count(db_data:DataFrame, prod_cn:DataFrame) -> Dict[bool, gg
     try:
         func_df = (
             merge(db_data[["department", "household_id"]], prod_cn[["household_id", "crop_name"]], on="household_id", how="left")
-            .groupby("department")["crop_name"]
+            .groupby("department", observed=True)["crop_name"]
             .value_counts().reset_index()
-            .groupby("department")["count"].sum().reset_index()
+            .groupby("department", observed=True)["count"].sum().reset_index()
             .sort_values("count", ascending=True)
         )
 
@@ -118,7 +125,7 @@ def irrigation_practice_by_household(db_data:DataFrame) -> Dict[bool, ggplot]:
     try:
         func_df = (
             db_data[["department", "household_id", "irrigation_practice_on_household_farm"]]
-            .groupby(["department", "irrigation_practice_on_household_farm"])["household_id"]
+            .groupby(["department", "irrigation_practice_on_household_farm"], observed=True)["household_id"]
             .count().reset_index()
             .assign(
                 irrigation_practice_on_household_farm = lambda _: where(
@@ -163,7 +170,7 @@ def root_tubers_share(db_data:DataFrame) -> Dict[bool, ggplot]:
         rt_cols = ["share_of_roots_and_tubers_consumed", "share_of_roots_and_tubers_sold"]
         func_df = (
             db_data[["department"]+rt_cols]
-            .groupby("department")[rt_cols]
+            .groupby("department", observed=True)[rt_cols]
             .agg("mean").reset_index()
             .assign(
                 share_of_roots_and_tubers_consumed = lambda _: round(_["share_of_roots_and_tubers_consumed"]*100, 2),
@@ -213,7 +220,7 @@ def households_use_irrigation_on_crops(filterd_data:DataFrame, prod_cn:DataFrame
                 on="household_id",
                 how="left"
             )
-            .groupby(["department", "crop_name"])["irrigation_practice_on_household_farm"]
+            .groupby(["department", "crop_name"], observed=True)["irrigation_practice_on_household_farm"]
             .value_counts()
             .reset_index()
             .assign(
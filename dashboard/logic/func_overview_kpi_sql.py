@@ -0,0 +1,134 @@
+from typing import Dict, List, Tuple
+import duckdb
+
+
+def fetch_one(database_path:str, query:str, parameters:List=None) -> Tuple:
+    """
+    First row of `query`, run on a read-only connection so only the result leaves DuckDB.
+    """
+    conn = duckdb.connect(database=database_path, read_only=True)
+    try:
+        return conn.execute(query, parameters or []).fetchone()
+    finally:
+        conn.close()
+
+
+def count_household_sql(database_path:str, department_name:str, table_name:str="irrigation") -> Dict[bool, int]:
+    """
+    Total household in a department, SQL version of `count_household`.
+    """
+    try:
+        count = fetch_one(
+            database_path,
+            f"SELECT count(DISTINCT household_id) FROM {table_name} WHERE department = ?",
+            [department_name]
+        )[0]
+        return {"error": False, "value": count}
+    except (ValueError, duckdb.Error) as e:
+        print(e)
+        return {"error": True, "value": None}
+
+
+def calculate_avg_processed_product_sql(database_path:str, department_name:str, table_name:str="irrigation") -> Dict[bool, float]:
+    """
+    SQL version of `calculate_avg_processed_product`.
+    """
+    try:
+        avg = fetch_one(
+            database_path,
+            f"SELECT avg(number_of_products_processed) FROM {table_name} WHERE department = ?",
+            [department_name]
+        )[0]
+        return {"error": False, "value": None if avg is None else round(avg, 1)}
+    except (ValueError, duckdb.Error) as e:
+        print(e)
+        return {"error": True, "value": None}
+
+
+def percent_perform_irrigation_sql(database_path:str, department_name:str, table_name:str="irrigation") -> Dict[bool, float]:
+    """
+    Percentage of household that performes irrigation, SQL version of `percent_perform_irrigation`.
+    """
+    try:
+        percent = fetch_one(
+            database_path,
+            f"""
+            SELECT count(*) FILTER (WHERE irrigation_practice_on_household_farm = 1)
+                / count(irrigation_practice_on_household_farm)
+            FROM {table_name}
+            WHERE department = ?
+            """,
+            [department_name]
+        )[0]
+        return {"error": False, "value": None if percent is None else round(percent*100, 1)}
+    except (ValueError, duckdb.Error) as e:
+        print(e)
+        return {"error": True, "value": None}
+
+
+def most_used_source_water_sql(database_path:str, department_name:str, table_name:str="irrigation") -> Dict[bool, str]:
+    """
+    Most used water source, SQL version of `most_used_source_water`.
+    """
+    try:
+        output = fetch_one(
+            database_path,
+            f"""
+            SELECT source_of_irrigation_water_used
+            FROM {table_name}
+            WHERE department = ? AND source_of_irrigation_water_used != 'NA'
+            GROUP BY source_of_irrigation_water_used
+            ORDER BY count(*) DESC, source_of_irrigation_water_used
+            LIMIT 1
+            """,
+            [department_name]
+        )
+        return {"error": False, "value": None if output is None else output[0]}
+    except (ValueError, duckdb.Error) as e:
+        print(e)
+        return {"error": True, "value": None}
+
+
+def get_department_kpis(database_path:str, department_name:str, table_name:str="department_kpis") -> Dict[bool, Dict]:
+    """
+    KPI card values of a department, looked up in the `department_kpis` table built by the
+    pipeline. Falls back to computing them from the irrigation table when it has no row yet.
+    """
+    try:
+        kpis = fetch_one(
+            database_path,
+            f"""
+            SELECT household_count, avg_processed_product, irrigation_percent, top_water_source
+            FROM {table_name}
+            WHERE department = ?
+            """,
+            [department_name]
+        )
+    except duckdb.CatalogException:
+        # Databases saved before the pipeline built the table.
+        kpis = None
+    except (ValueError, duckdb.Error) as e:
+        print(e)
+        kpis = None
+
+    if kpis is not None:
+        household_count, avg_processed_product, irrigation_percent, top_water_source = kpis
+        return {
+            "error": False,
+            "value": {
+                "household_count": household_count,
+                "avg_processed_product": None if avg_processed_product is None else round(avg_processed_product, 1),
+                "irrigation_percent": None if irrigation_percent is None else round(irrigation_percent, 1),
+                "top_water_source": top_water_source
+            }
+        }
+
+    kpi_outputs = {
+        "household_count": count_household_sql(database_path, department_name),
+        "avg_processed_product": calculate_avg_processed_product_sql(database_path, department_name),
+        "irrigation_percent": percent_perform_irrigation_sql(database_path, department_name),
+        "top_water_source": most_used_source_water_sql(database_path, department_name)
+    }
+    if any(kpi_output["error"] for kpi_output in kpi_outputs.values()):
+        return {"error": True, "value": None}
+    return {"error": False, "value": {name: kpi_output["value"] for name, kpi_output in kpi_outputs.items()}}
@@ -1,17 +1,36 @@
-from pandas import DataFrame, to_datetime, concat
+from pandas import DataFrame, to_datetime, concat, date_range, DateOffset
+from numpy import arange, isnan, where, sqrt, maximum, repeat, tile
+from statistics import NormalDist
+from time import perf_counter
+from typing import List
 import calendar
+import duckdb
 
 import matplotlib.pyplot as plt
 from seaborn import lineplot
 
 from prophet import Prophet
 
+from logic.func_forecast_model_cache import (
+    fit_or_load_prophet_model, 
+    load_cached_model,
+    load_cached_forecast,
+    remember_forecast,
+    rainfall_data_hash,
+    rainfall_series_hash, 
+    model_cache_key
+)
+
 from sklearn.metrics import mean_squared_error, mean_absolute_error
 
 import warnings
 warnings.filterwarnings("ignore")
 
 
+prophet_model_settings = {"seasonality_mode": "multiplicative"}
+forecast_engines = ["prophet", "climatology"]
+
+
 def clean_rainfall_data(raw_rainfall_data: DataFrame) -> DataFrame:
     """
     :params
@@ -67,51 +86,146 @@ def clean_rainfall_data(raw_rainfall_data: DataFrame) -> DataFrame:
 
 
 
+def department_rainfall_series(rainfall_data:DataFrame, department:str) -> DataFrame:
+    """
+    Monthly rainfall of `department` as the "ds" and "y" columns Prophet is fitted on.
+    """
+    return (
+        rainfall_data
+        .query(f"department	== '{department}'")[["date", "rainfall_qty"]]
+        .rename(columns={'date':'ds', 'rainfall_qty':'y'})
+        .sort_values(by="ds", ascending=True)
+        .reset_index(drop=True)
+    )
+
+
+def forecast_model_version(fct_df:DataFrame, department:str) -> str:
+    """
+    Version of the model fitted on `fct_df`, changes with the data and the model settings.
+    """
+    return model_cache_key(department, rainfall_series_hash(fct_df), prophet_model_settings)
+
+
+def climatology_forecast(rainfall_data:DataFrame, n_future_period:int=24, interval_width:float=0.8) -> DataFrame:
+    """
+    Forecast of every department at once: the mean rainfall of each calendar month, with a normal
+    interval of `interval_width` (Prophet's default width) from the spread of that month.
+
+    The departments x months matrix is reduced to departments x 12 calendar months with two
+    matrix products, so all departments take a few milliseconds.
+    """
+    monthly = rainfall_data.assign(ds=to_datetime(rainfall_data["date"])).pivot_table(
+        index="department", columns="ds", values="rainfall_qty", observed=True
+    )
+    values = monthly.to_numpy(dtype="float64")
+    valid = ~isnan(values)
+    values = where(valid, values, 0)
+
+    # Months x 12 indicator of the calendar month of each column.
+    calendar_months = (monthly.columns.month.to_numpy()[:, None] == arange(1, 13)).astype("float64")
+    counts = valid @ calendar_months
+    if (counts == 0).any():
+        raise ValueError("Each department needs at least one value of each calendar month.")
+
+    mean = (values @ calendar_months) / counts
+    std = sqrt(maximum((values**2 @ calendar_months) / counts - mean**2, 0))
+    z = NormalDist().inv_cdf(0.5 + interval_width / 2)
+
+    future = date_range(monthly.columns.max() + DateOffset(months=1), periods=n_future_period, freq="MS")
+    future_months = future.month.to_numpy() - 1
+    yhat = mean[:, future_months]
+    spread = z * std[:, future_months]
+
+    return DataFrame({
+        "department": repeat(monthly.index.to_numpy(), n_future_period),
+        "ds": tile(future, monthly.shape[0]),
+        "yhat": yhat.ravel(),
+        "yhat_lower": maximum(yhat - spread, 0).ravel(),
+        "yhat_upper": (yhat + spread).ravel()
+    })
+
+
+def all_departments_climatology_forecast(rainfall_data:DataFrame, n_future_period:int=24) -> DataFrame:
+    """
+    `climatology_forecast` of every department, computed once per rainfall data and horizon and
+    kept in memory, so each department is then a slice of it.
+    """
+    key = f"climatology-{rainfall_data_hash(rainfall_data)}-{n_future_period}"
+
+    forecast = load_cached_forecast(key)
+    if forecast is None:
+        forecast = climatology_forecast(rainfall_data, n_future_period)
+        remember_forecast(key, forecast)
+
+    return forecast
+
+
 def forecast_rainfall_monthly_quantity(
         rainfall_data:DataFrame, 
         department:str, 
         n_future_period:int=24,
-        append_new_data:DataFrame=None
+        append_new_data:DataFrame=None,
+        use_model_cache:bool=True,
+        engine:str="prophet"
 ):
     """ 
     params:
         rainfall_data: histotical rainfall dataset.
         department: selected department to predict future rainfall quantity.
         n_future_period: Number of future period to predict.
-        append_new_data: add new data to the existing dataset.
+        append_new_data: add new data to the existing dataset, the model is warm-started from
+            the cached model of `rainfall_data`.
+        use_model_cache: reuse the model fitted on the same department, data and settings.
+        engine: "prophet", or "climatology" for the monthly means of `climatology_forecast`.
     return:
-        A tupel of length 3 containing  the forecast, historical and Prophet model.
+        A tupel of length 3 containing  the forecast, historical and Prophet model (None with
+        the "climatology" engine).
     """
+    if engine not in forecast_engines:
+        raise ValueError(f"`engine` must be any of {forecast_engines}")
 
     # Data Preparation
-    df = rainfall_data.copy()
+    # Only the rows of the department are copied, not the whole history.
+    department_df = rainfall_data.loc[rainfall_data["department"] == department]
     
     try:
         if append_new_data is not None:
             # Check that the first date in the new data is ahead of the last-date in the current data
-            if not append_new_data["date"].min() > df["date"].max():
+            if not append_new_data["date"].min() > rainfall_data["date"].max():
                 raise ValueError("New data containes clashing dates with current data.")
             
             try:
-                df = concat([df, append_new_data], axis=0)
+                department_df = concat(
+                    [department_df, append_new_data.loc[append_new_data["department"] == department]],
+                    axis=0
+                )
             except ValueError as e:
                 print(f"Unable to append new data.\n{e}")
 
 
-        fct_df = (
-            df
-            .query(f"department	== '{department}'")[["date", "rainfall_qty"]]
-            .rename(columns={'date':'ds', 'rainfall_qty':'y'})
-            .sort_values(by="ds", ascending=True)
-            .reset_index(drop=True)
-        )
+        fct_df = department_rainfall_series(department_df, department)
+
+        if engine == "climatology":
+            if append_new_data is None:
+                forecast = all_departments_climatology_forecast(rainfall_data, n_future_period)
+                forecast = forecast.loc[forecast["department"] == department].reset_index(drop=True)
+            else:
+                forecast = climatology_forecast(department_df, n_future_period)
+            return {"error": False, "values": (forecast.drop("department", axis=1), fct_df, None)}
         
         # Fitting
-        pp_mdl = Prophet(seasonality_mode="multiplicative")
-        # seasonality_mode="multiplicative",
         # yearly_seasonality="auto"
-
-        pp_mdl.fit(fct_df)
+        if use_model_cache:
+            previous_model = None
+            if append_new_data is not None:
+                # Warm start from the model fitted before the new months were added, when cached.
+                previous_model = load_cached_model(
+                    forecast_model_version(department_rainfall_series(rainfall_data, department), department)
+                )
+            pp_mdl = fit_or_load_prophet_model(fct_df, department, prophet_model_settings, previous_model)
+        else:
+            pp_mdl = Prophet(**prophet_model_settings)
+            pp_mdl.fit(fct_df)
 
         # Forecasting
         future_df = pp_mdl.make_future_dataframe(
@@ -131,6 +245,138 @@ def forecast_rainfall_monthly_quantity(
 
 
 
+def backtest_forecast(
+        rainfall_data:DataFrame,
+        department:str,
+        cutoff:str,
+        horizon:int=12,
+        engine:str="prophet"
+):
+    """ 
+    Fit `engine` on the rainfall of `department` up to `cutoff` and compare its forecast of the
+    next `horizon` months with the observed rainfall. The model cache is bypassed so
+    "fit_seconds" is the real cost of a fit.
+    return:
+        One row per forecasted month with its "horizon" (1 for the month after `cutoff`), the
+        observed "y", the forecasted "yhat" and the "fit_seconds" of the run.
+    """
+    try:
+        dates = to_datetime(rainfall_data["date"])
+        cutoff = to_datetime(cutoff)
+
+        start = perf_counter()
+        forecast_dict = forecast_rainfall_monthly_quantity(
+            rainfall_data.loc[dates <= cutoff], department, horizon, use_model_cache=False, engine=engine
+        )
+        fit_seconds = perf_counter() - start
+        if forecast_dict["error"]:
+            return {"error": True, "data": None}
+
+        forecast, _, _ = forecast_dict["values"]
+        observed = department_rainfall_series(rainfall_data.loc[dates > cutoff], department).assign(
+            ds=lambda _: to_datetime(_["ds"])
+        )
+        func_df = (
+            forecast[["ds", "yhat"]]
+            .assign(horizon=range(1, horizon + 1))
+            .merge(observed, on="ds", how="inner")
+            .assign(department=department, engine=engine, cutoff=cutoff, fit_seconds=fit_seconds)
+        )
+        return {"error": False, "data": func_df}
+    except ValueError as e:
+        print(e)
+        return {"error": True, "data": None}
+
+
+def backtest_scores(backtest_df:DataFrame, by:List[str]=["engine"]):
+    """ 
+    RMSE, MAE and mean fit time of the `backtest_forecast` rows of each `by` group.
+    """
+    try:
+        fit_seconds = backtest_df.groupby(by, observed=True)["fit_seconds"].mean()
+        func_df = (
+            backtest_df.groupby(by, observed=True)
+            .apply(lambda _: DataFrame({
+                "rmse": [sqrt(mean_squared_error(_["y"], _["yhat"]))],
+                "mae": [mean_absolute_error(_["y"], _["yhat"])],
+                "n_months": [_.shape[0]]
+            }))
+            .reset_index(level=-1, drop=True)
+            .join(fit_seconds)
+            .reset_index()
+        )
+        return {"error": False, "data": func_df}
+    except (ValueError, KeyError) as e:
+        print(e)
+        return {"error": True, "data": None}
+
+
+def read_precomputed_forecast(
+        database_path:str,
+        rainfall_data:DataFrame,
+        department:str,
+        n_future_period:int=24,
+        table_name:str="rainfall_forecast"
+):
+    """ 
+    Forecast of `department` precomputed by the pipeline, in the same shape as
+    `forecast_rainfall_monthly_quantity` (without the model). It is only used when it was
+    computed from the current `rainfall_data` and covers `n_future_period` months, otherwise
+    "error" is True and the forecast has to be computed.
+    """
+    try:
+        fct_df = department_rainfall_series(rainfall_data, department)
+
+        conn = duckdb.connect(database=database_path, read_only=True)
+        try:
+            forecast = conn.execute(
+                f"""
+                SELECT ds, yhat, yhat_lower, yhat_upper
+                FROM {table_name}
+                WHERE department = ? AND model_version = ?
+                ORDER BY ds
+                LIMIT ?
+                """,
+                [department, forecast_model_version(fct_df, department), n_future_period]
+            ).df()
+        finally:
+            conn.close()
+
+        if forecast.shape[0] < n_future_period:
+            return {"error": True, "values": (None, None, None)}
+        return {"error": False, "values": (forecast, fct_df, None)}
+    except duckdb.CatalogException:
+        # Databases without precomputed forecasts.
+        return {"error": True, "values": (None, None, None)}
+    except (ValueError, duckdb.Error) as e:
+        print(e)
+        return {"error": True, "values": (None, None, None)}
+
+
+def department_forecast_records(
+        database_path:str,
+        rainfall_data:DataFrame,
+        department:str,
+        n_future_period:int=24,
+        engine:str="prophet"
+):
+    """ 
+    History and forecast records of `department` for the overview charts. With the "prophet"
+    engine the forecast precomputed by the pipeline is used when it is current, the model is
+    fitted otherwise. Runs outside the Shiny event loop, see `forecast_task` in the overview module.
+    """
+    forecast_dict = {"error": True}
+    if engine == "prophet":
+        forecast_dict = read_precomputed_forecast(database_path, rainfall_data, department, n_future_period)
+    if forecast_dict["error"]:
+        forecast_dict = forecast_rainfall_monthly_quantity(rainfall_data, department, n_future_period, engine=engine)
+    if forecast_dict["error"]:
+        return {"error": True, "data": None}
+
+    forecast, orginal_cleaned_df, _ = forecast_dict["values"]
+    return forecast_output(orginal_cleaned_df, forecast, "table")
+
+
 def forecast_output(main_df:DataFrame, forecasted_df:DataFrame, output_type:str="table"):
     """ 
     """
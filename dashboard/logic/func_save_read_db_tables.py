@@ -1,37 +1,36 @@
-from pandas import DataFrame, read_sql
+from pandas import DataFrame, to_numeric
+from typing import List
 import duckdb
 
 import warnings
 warnings.filterwarnings("ignore")
 
-def save_data_to_database(
-        new_database_path:str, 
-        cleaned_data:DataFrame, 
-        cleaned_data_table_name:str,
-        prod_name_code:DataFrame,
-        prod_name_code_table_name:str,
-):
-    """ """
-    # Create new duckdb database
-    conn = duckdb.connect(database=new_database_path) 
-
-    # Move data into database
-    cleaned_data.to_sql(cleaned_data_table_name, conn, index=False)
-    prod_name_code.to_sql(prod_name_code_table_name, conn, index=False) 
-
-    # Close connection
-    conn.close()
-
-
-
-def read_data_from_database(database_path:str, table_name:str) -> DataFrame:
-    """ """
+def narrow_dtypes(db_table:DataFrame, categorical_columns:List[str]=None) -> DataFrame:
+    """ 
+    Downcast integer columns to the smallest type that holds them and turn the
+    `categorical_columns` still stored as strings into categoricals.
+    """
+    for col in db_table.columns:
+        if db_table[col].dtype.kind in "iu":
+            db_table[col] = to_numeric(db_table[col], downcast="integer")
+        elif categorical_columns is not None and col in categorical_columns and db_table[col].dtype == "O":
+            db_table[col] = db_table[col].astype("category")
+
+    return db_table
+
+
+def read_data_from_database(database_path:str, table_name:str, categorical_columns:List[str]=None) -> DataFrame:
+    """ 
+    ENUM columns are loaded as categoricals and small integer columns keep their width.
+    The dashboard only reads, the connection is read-only like the ones of the KPI and forecast
+    lookups: DuckDB does not open one file with different configurations in the same process.
+    """
     # Create a new connection to database
-    new_conn = duckdb.connect(database=database_path) 
+    new_conn = duckdb.connect(database=database_path, read_only=True) 
 
-    db_table = read_sql(f"SELECT * FROM {table_name}", new_conn)
+    db_table = new_conn.execute(f"SELECT * FROM {table_name}").df()
 
     # Close connection
     new_conn.close()
 
-    return db_table
\ No newline at end of file
+    return narrow_dtypes(db_table, categorical_columns)
\ No newline at end of file
@@ -10,7 +10,7 @@ from logic.func_ui_data_input import (
     check_accurate_new_data
 )
 from logic.func_save_read_db_tables import read_data_from_database
-from logic.func_data_input import get_unique_values_list
+from logic.func_data_input import get_unique_values_list, build_department_index
 
 
 
@@ -57,12 +57,24 @@ def data_input_server(input:Inputs, output:Outputs, session:Session, temp:dict):
     @reactive.event(input.upload_db_data)
     def db_data_dict():
         try:
-            irg_data = read_data_from_database(db_path, "irrigation")
+            irg_data = read_data_from_database(
+                db_path, 
+                "irrigation", 
+                categorical_columns=["department", "gender_of_head_of_household", "source_of_irrigation_water_used"]
+            )
             return {"error": False, "data": irg_data}
         except ValueError as e:
             print(e)
             return {"error": True, "data": None}
 
+    # Built once each time the data is loaded
+    @reactive.Calc
+    def department_index_dict():
+        req(db_data_dict)
+        if not db_data_dict()["error"]:
+            return build_department_index(db_data_dict()["data"])
+        return {"error": True, "value": None}
+
     @reactive.Calc
     @reactive.event(input.upload_db_data)
     def prod_cn_dict():
@@ -89,7 +101,11 @@ def data_input_server(input:Inputs, output:Outputs, session:Session, temp:dict):
     def _():
         req(db_data_dict)
         if not db_data_dict()["error"]:
-            dep_choice = get_unique_values_list(db_data_dict()["data"], "department")
+            dep_choice = get_unique_values_list(
+                db_data_dict()["data"], 
+                "department", 
+                department_index=department_index_dict()["value"]
+            )
 
             if not dep_choice["error"]:
                 ui.update_select(
@@ -107,7 +123,8 @@ def data_input_server(input:Inputs, output:Outputs, session:Session, temp:dict):
                 db_data_dict()["data"], 
                 "household_id",
                 "department",
-                input.department_selection()
+                input.department_selection(),
+                department_index=department_index_dict()["value"]
             )
             if not hus_choice["error"]:
                 ui.update_select(
@@ -258,6 +275,8 @@ def data_input_server(input:Inputs, output:Outputs, session:Session, temp:dict):
     return {
         "error": check_accurate_data, 
         "db_data": db_data_dict,  
+        "department_index": department_index_dict,
         "prod_nc": prod_cn_dict,
-        "rainfall_qty": rainfall_qty
+        "rainfall_qty": rainfall_qty,
+        "db_path": db_path
     }
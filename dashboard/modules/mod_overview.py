@@ -1,4 +1,6 @@
 from shiny import Inputs, Outputs, Session, module, render, ui, reactive, req
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 
 from components.comp_global import filter_dropdowns, ui_column, ui_row
 from components.comp_overview import (
@@ -10,7 +12,17 @@ from faicons import icon_svg
 
 from logic.func_data_input import get_unique_values_list
 from logic.func_overview_backend import *
-from logic.func_rainfall_forecasting_process import forecast_rainfall_monthly_quantity, forecast_output
+from logic.func_overview_kpi_sql import get_department_kpis
+from logic.func_binary_answers import (
+    binary_answers_labels,
+    build_binary_answers_histogram,
+    count_households_with_answers
+)
+from logic.func_rainfall_forecasting_process import department_forecast_records
+
+
+# Forecasts are fitted on these threads so a fit never blocks the other outputs of the process.
+forecast_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="forecast")
 
 
 
@@ -40,6 +52,27 @@ def overview_ui():
             )
         ),
 
+        # -------------------------------------------------------------
+        ui.card(
+            ui_row(
+                ui_column(
+                    ui.input_checkbox_group(
+                        id="binary_answers_selection",
+                        label="Households that answered yes to",
+                        choices=binary_answers_labels
+                    ),
+                    ui.input_radio_buttons(
+                        id="binary_answers_match",
+                        label="",
+                        choices={"all": "All selected", "any": "Any selected", "none": "None selected"},
+                        inline=True
+                    ),
+                    span=4
+                ),
+                ui_column(ui.output_data_frame(id="binary_answers_counts"), span=8)
+            )
+        ),
+
         ui.hr(),
         # -------------------------------------------------------------
         ui_row(
@@ -77,6 +110,22 @@ def overview_ui():
         ui.card(
             ui_row(
                 ui_column(
+                    ui.input_radio_buttons(
+                        id="forecast_engine",
+                        label=None,
+                        choices={"prophet": "Prophet", "climatology": "Monthly climatology (fast)"},
+                        selected="prophet",
+                        inline=True
+                    ),
+                    ui.input_slider(
+                        id="forecast_horizon",
+                        label="Forecast horizon (months)",
+                        min=6,
+                        max=48,
+                        value=24,
+                        step=6
+                    ),
+                    ui.output_ui("forecast_status"),
                     ui.navset_pill(
                         ui.nav_panel("All", ui.output_plot(id="all_rainfall_values_plot")),
                         ui.nav_panel("Forecaset only", ui.output_plot(id="forecast_values_plot")),
@@ -109,6 +158,11 @@ def overview_server(input:Inputs, output:Outputs, session:Session, data_dict:dic
 
         if not data_dict["error"]() and not data_dict["db_data"]()["error"]:
             return data_dict["db_data"]()["data"]
+
+    @reactive.Calc
+    def department_index():
+        req(db_data)
+        return data_dict["department_index"]()["value"]
         
     @reactive.Calc
     def prod_nc():
@@ -129,7 +183,7 @@ def overview_server(input:Inputs, output:Outputs, session:Session, data_dict:dic
     @reactive.effect
     def _():
         req(db_data)
-        dep_choice = get_unique_values_list(db_data(), "department")
+        dep_choice = get_unique_values_list(db_data(), "department", department_index=department_index())
 
         if not dep_choice["error"]:
             ui.update_select(
@@ -143,47 +197,72 @@ def overview_server(input:Inputs, output:Outputs, session:Session, data_dict:dic
     def fdb_data():
         req(db_data, input.ove_department_selection)
 
-        filt_df = filter_department(db_data(), input.ove_department_selection())
+        filt_df = filter_department(db_data(), input.ove_department_selection(), department_index())
         if not filt_df["error"]:
             return filt_df["data"]
         else:
             return None
         
+    # KPI cards are a single lookup in the department_kpis table built by the pipeline.
+    @reactive.Calc
+    def department_kpis():
+        req(db_data, input.ove_department_selection)
+
+        kpis = get_department_kpis(data_dict["db_path"], input.ove_department_selection())
+        if not kpis["error"]:
+            return kpis["value"]
+
+    # Cross-filter counts of the binary answers ------------------
+    @reactive.Calc
+    def binary_answers_histogram():
+        req(db_data)
+
+        histogram = build_binary_answers_histogram(db_data())
+        if not histogram["error"]:
+            return histogram["value"]
+
+    @output(id="binary_answers_counts")
+    @render.data_frame
+    def binary_answers_counts():
+        req(binary_answers_histogram())
+
+        df_dict = count_households_with_answers(
+            binary_answers_histogram(), 
+            list(input.binary_answers_selection()), 
+            input.binary_answers_match()
+        )
+        if not df_dict["error"]:
+            func_df = df_dict["data"]
+            func_df.columns = ["Department", "No. Households", "Proportion"]
+            return func_df
+
     # Household count --------------------------------------------
     @output(id="dep_household_count")
     @render.ui
     def _():
-        req(fdb_data)
-        count_value = count_household(fdb_data())
-        if not count_value["error"]:
-            return household_count_card(count_value["value"])
+        req(department_kpis())
+        return household_count_card(department_kpis()["household_count"])
         
     # Number of processed products --------------------------------
     @output(id="avg_pro_prod_input")
     @render.ui
     def _():
-        req(fdb_data)
-        txt_output = calculate_avg_processed_product(fdb_data())
-        if not txt_output["error"]:
-            return metric_output("process_product", txt_output["value"])
+        req(department_kpis())
+        return metric_output("process_product", department_kpis()["avg_processed_product"])
         
     # Percentage of farmers that performed irrigation
     @output(id="perform_irrigation_input")
     @render.ui
     def _():
-        req(fdb_data)
-        txt_output = percent_perform_irrigation(fdb_data())
-        if not txt_output["error"]:
-            return metric_output("proportion_irrigation", txt_output["value"])
+        req(department_kpis())
+        return metric_output("proportion_irrigation", department_kpis()["irrigation_percent"])
 
     # Most used source of water.
     @output(id="source_water_input")
     @render.ui
     def _():
-        req(fdb_data)
-        txt_output = most_used_source_water(fdb_data())
-        if not txt_output["error"]:
-            return metric_output("water_source", txt_output["value"], False)
+        req(department_kpis())
+        return metric_output("water_source", department_kpis()["top_water_source"], False)
     
 
     # ------------------------------------------------------------------
@@ -225,22 +304,52 @@ def overview_server(input:Inputs, output:Outputs, session:Session, data_dict:dic
 
     # Timeseries -------------------------------------------------------
     # Forecast:
-    @reactive.Calc
-    def forecast():
-        req(rainfall_qty, input.ove_department_selection)
+    # The fit runs as an extended task on `forecast_executor`, the outputs that need it show
+    # their in-progress state meanwhile. Fitted models are cached without their horizon, so
+    # changing `forecast_horizon` only re-predicts.
+    @reactive.extended_task
+    async def forecast_task(database_path, rainfall_data, department, n_future_period, engine):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            forecast_executor,
+            department_forecast_records,
+            database_path,
+            rainfall_data,
+            department,
+            n_future_period,
+            engine
+        )
 
-        forecast_dict = forecast_rainfall_monthly_quantity(
-            rainfall_qty(), 
+    @reactive.effect
+    def _():
+        rainfall_data = rainfall_qty()
+        req(rainfall_data is not None, input.ove_department_selection())
+
+        # A fit that has not started yet is dropped when the department changes, a running
+        # one finishes on its thread (its model is cached) but its result is ignored.
+        forecast_task.cancel()
+        forecast_task(
+            data_dict["db_path"],
+            rainfall_data,
             input.ove_department_selection(),
-            n_future_period=24
+            input.forecast_horizon(),
+            input.forecast_engine()
         )
-        if not forecast_dict["error"]:
-            forecast, orginal_cleaned_df, _ = forecast_dict["values"]
-            all_records_dict = forecast_output(orginal_cleaned_df, forecast, "table")
 
-            if not all_records_dict["error"]:
-                return all_records_dict["data"]
-                    
+    @reactive.Calc
+    def forecast():
+        all_records_dict = forecast_task.result()
+        if not all_records_dict["error"]:
+            return all_records_dict["data"]
+
+    @output(id="forecast_status")
+    @render.ui
+    def _():
+        if forecast_task.status() == "running":
+            return ui.p("Fitting the forecast model…", class_="text-muted mb-1")
+        if forecast_task.status() == "error":
+            return ui.p("The forecast could not be computed.", class_="text-danger mb-1")
+
     # output:
     # All records:
     @output(id="all_rainfall_values_plot")
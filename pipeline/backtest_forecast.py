@@ -0,0 +1,86 @@
+from pandas import DataFrame, to_datetime, concat, DateOffset
+from concurrent.futures import ProcessPoolExecutor
+from argparse import ArgumentParser
+from pathlib import Path
+from typing import List, Tuple
+import sys
+
+from save_read_table import read_data_from_database
+
+# The forecasting code is shared with the dashboard.
+sys.path.append(str(Path(__file__).resolve().parent.parent / "dashboard"))
+from logic.func_rainfall_forecasting_process import backtest_forecast, backtest_scores, forecast_engines
+
+
+def rolling_origins(rainfall_data:DataFrame, n_origins:int=4, horizon:int=12, step:int=6) -> List:
+    """
+    `n_origins` cutoffs `step` months apart, the last one leaving `horizon` months to score.
+    """
+    last_date = to_datetime(rainfall_data["date"]).max()
+    return [
+        last_date - DateOffset(months=horizon + step * origin)
+        for origin in reversed(range(n_origins))
+    ]
+
+
+def backtest_task(task:Tuple[DataFrame, str, str, int, str]) -> DataFrame:
+    """
+    One department, cutoff and engine, run in a worker process by `run_backtest`.
+    """
+    rainfall_data, department, cutoff, horizon, engine = task
+
+    backtest_dict = backtest_forecast(rainfall_data, department, cutoff, horizon, engine)
+    if backtest_dict["error"]:
+        print(f"Unable to backtest {engine} on {department} at {cutoff}")
+        return DataFrame()
+    return backtest_dict["data"]
+
+
+def run_backtest(
+        rainfall_data:DataFrame,
+        engines:List[str]=forecast_engines,
+        n_origins:int=4,
+        horizon:int=12,
+        step:int=6,
+        n_workers:int=None
+) -> DataFrame:
+    """
+    Rolling-origin backtest of each engine on each department, the department x cutoff x engine
+    runs are spread over a process pool.
+    """
+    tasks = [
+        (department_rainfall, department, cutoff, horizon, engine)
+        for department, department_rainfall in rainfall_data.groupby("department", observed=True)
+        for cutoff in rolling_origins(rainfall_data, n_origins, horizon, step)
+        for engine in engines
+    ]
+
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        results = [result for result in executor.map(backtest_task, tasks) if result.shape[0] > 0]
+
+    if len(results) == 0:
+        raise ValueError("No backtest run succeeded")
+    return concat(results, ignore_index=True)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Rolling-origin backtest of the rainfall forecast engines.")
+    parser.add_argument("--database-path", default="../dashboard/db/dash_db.duckdb")
+    parser.add_argument("--engines", nargs="+", choices=forecast_engines, default=forecast_engines)
+    parser.add_argument("--origins", type=int, default=4, help="Number of rolling cutoffs.")
+    parser.add_argument("--horizon", type=int, default=12, help="Months forecasted after each cutoff.")
+    parser.add_argument("--step", type=int, default=6, help="Months between two cutoffs.")
+    parser.add_argument("--n-workers", type=int, default=None, help="Defaults to the number of CPUs.")
+    parser.add_argument("--output-path", default=None, help="CSV file for the month by month errors.")
+    args = parser.parse_args()
+
+    rainfall_data = read_data_from_database(args.database_path, "rainfall_qty")
+    backtest_df = run_backtest(rainfall_data, args.engines, args.origins, args.horizon, args.step, args.n_workers)
+
+    if args.output_path is not None:
+        backtest_df.to_csv(args.output_path, index=False)
+
+    for by in [["engine"], ["engine", "horizon"], ["engine", "department"]]:
+        scores = backtest_scores(backtest_df, by)
+        if not scores["error"]:
+            print(scores["data"].to_string(index=False), end="\n\n")
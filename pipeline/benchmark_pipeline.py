@@ -0,0 +1,197 @@
+from pandas.testing import assert_frame_equal
+from argparse import ArgumentParser
+from time import perf_counter
+import tracemalloc
+from os.path import join, getsize
+from tempfile import gettempdir, TemporaryDirectory
+from typing import Callable, Dict, List
+
+from data_import_clean import (
+    db_select_columns,
+    db_rename_columns,
+    db_unique_departments,
+    convert_to_int_variables,
+    convert_to_float_variables,
+    binary_qs_variables_name,
+
+    convert_string_to_numeric,
+    coerce_numeric_variables,
+    clean_variables,
+    read_select_variables,
+    run_cleaning_transformation_process
+)
+from polars_engine import read_select_variables_lazy, run_cleaning_transformation_process_lazy
+from synthetic_survey import messy_numeric_data, synthetic_survey_data, write_synthetic_survey_csv
+from pipeline_timing import new_timing_report
+from run_pipeline import run_in_memory_pipeline, run_chunked_pipeline
+
+
+def time_function(func:Callable, n_repeat:int=3) -> float:
+    """
+    Best wall time of `n_repeat` runs in seconds.
+    """
+    timings = []
+    for _ in range(n_repeat):
+        start = perf_counter()
+        func()
+        timings.append(perf_counter() - start)
+    return min(timings)
+
+
+def benchmark_numeric_coercion(n_rows:int, n_repeat:int=3) -> Dict[str, float]:
+    """
+    Compare `convert_string_to_numeric` called once per column with `coerce_numeric_variables`.
+    """
+    df = messy_numeric_data(n_rows)
+
+    def per_column():
+        for col in convert_to_int_variables:
+            convert_string_to_numeric(df, col, convert_int=True)
+        for col in convert_to_float_variables:
+            convert_string_to_numeric(df, col, convert_int=False)
+
+    def single_pass():
+        coerce_numeric_variables(df, convert_to_int_variables, convert_to_float_variables)
+
+    per_column_time = time_function(per_column, n_repeat)
+    single_pass_time = time_function(single_pass, n_repeat)
+
+    return {
+        "n_rows": n_rows,
+        "convert_string_to_numeric_s": round(per_column_time, 4),
+        "coerce_numeric_variables_s": round(single_pass_time, 4),
+        "speedup": round(per_column_time / single_pass_time, 2)
+    }
+
+
+def benchmark_clean_variables(n_rows:int) -> Dict[str, float]:
+    """
+    Wall time and peak traced memory of `clean_variables` on a synthetic survey. Memory is traced
+    in a separate run since tracing slows the cleaning down.
+    """
+    clean_kwargs = {
+        "db_binary_variables": binary_qs_variables_name,
+        "db_conv_int_variables": convert_to_int_variables,
+        "db_conv_float_variables": convert_to_float_variables
+    }
+
+    df = synthetic_survey_data(n_rows)
+    start = perf_counter()
+    clean_variables(df, **clean_kwargs)
+    wall_time = perf_counter() - start
+
+    df = synthetic_survey_data(n_rows)
+    tracemalloc.start()
+    clean_variables(df, **clean_kwargs)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "n_rows": n_rows,
+        "clean_variables_s": round(wall_time, 4),
+        "clean_variables_peak_mb": round(peak_memory / 1024**2, 1)
+    }
+
+
+def benchmark_engines(n_rows:int, file_path:str=None) -> Dict[str, float]:
+    """
+    Read, clean and transform the same synthetic survey with the pandas and the Polars engine,
+    and check that both produce identical tables.
+    """
+    if file_path is None:
+        file_path = join(gettempdir(), "benchmark_survey.csv")
+    write_synthetic_survey_csv(file_path, n_rows)
+    clean_kwargs = {
+        "db_binary_variables": binary_qs_variables_name,
+        "db_conv_int_variables": convert_to_int_variables,
+        "db_conv_float_variables": convert_to_float_variables
+    }
+
+    start = perf_counter()
+    db_data = read_select_variables(file_path, db_select_columns, db_rename_columns, db_unique_departments)
+    pandas_cleaned, pandas_prod_code_name = run_cleaning_transformation_process(db_data, **clean_kwargs)
+    pandas_time = perf_counter() - start
+
+    start = perf_counter()
+    polars_cleaned, polars_prod_code_name = run_cleaning_transformation_process_lazy(
+        read_select_variables_lazy(file_path, db_select_columns, db_rename_columns, db_unique_departments),
+        **clean_kwargs
+    )
+    polars_time = perf_counter() - start
+
+    assert_frame_equal(pandas_cleaned.reset_index(drop=True), polars_cleaned)
+    assert_frame_equal(pandas_prod_code_name.reset_index(drop=True), polars_prod_code_name)
+
+    return {
+        "n_rows": n_rows,
+        "pandas_s": round(pandas_time, 4),
+        "polars_s": round(polars_time, 4),
+        "speedup": round(pandas_time / polars_time, 2)
+    }
+
+def benchmark_scaling(sizes:List[int], chunksize:int=None, seed:int=0) -> List[Dict]:
+    """
+    Run `read_select_variables` -> `run_cleaning_transformation_process` -> `save_data_to_database`
+    on a synthetic survey of each size and report the throughput and peak RSS of every stage.
+    With `chunksize` the chunked pipeline is used, the whole run is then a single stage.
+    """
+    results = []
+    for n_rows in sizes:
+        with TemporaryDirectory() as work_dir:
+            file_path = join(work_dir, "synthetic_survey.csv")
+            database_path = join(work_dir, "benchmark.duckdb")
+            write_synthetic_survey_csv(file_path, n_rows, seed)
+
+            timing_report = new_timing_report(n_rows=n_rows, chunksize=chunksize)
+            if chunksize is None:
+                run_in_memory_pipeline(file_path, database_path, timing_report=timing_report)
+            else:
+                run_chunked_pipeline(file_path, database_path, chunksize, timing_report=timing_report)
+
+            stages = timing_report["stages"]
+            total_time = sum(stage["wall_time_s"] for stage in stages)
+            result = {
+                "n_rows": n_rows,
+                "csv_mb": round(getsize(file_path) / 1024**2, 1),
+                "total_s": round(total_time, 4),
+                "rows_per_s": round(n_rows / total_time) if total_time > 0 else None,
+                "peak_rss_mb": max((stage["peak_rss_mb"] for stage in stages), default=None),
+                "stages": {
+                    stage["stage"]: {
+                        "wall_time_s": stage["wall_time_s"],
+                        "rows_per_s": round(n_rows / stage["wall_time_s"]) if stage["wall_time_s"] > 0 else None,
+                        "peak_rss_mb": stage["peak_rss_mb"]
+                    }
+                    for stage in stages
+                }
+            }
+        print(result)
+        results.append(result)
+
+    return results
+
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Benchmark the cleaning pipeline.")
+    parser.add_argument("--n-rows", type=int, default=1_000_000)
+    parser.add_argument("--n-repeat", type=int, default=3)
+    parser.add_argument("--benchmark", choices=["numeric", "clean", "engines", "scaling"], default="numeric")
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10_000, 1_000_000, 10_000_000],
+        help="Survey sizes of the scaling benchmark."
+    )
+    parser.add_argument(
+        "--chunksize", type=int, default=None,
+        help="Run the scaling benchmark with the chunked pipeline, needed when a survey does not fit in memory."
+    )
+    args = parser.parse_args()
+
+    if args.benchmark == "numeric":
+        print(benchmark_numeric_coercion(args.n_rows, args.n_repeat))
+    elif args.benchmark == "clean":
+        print(benchmark_clean_variables(args.n_rows))
+    elif args.benchmark == "engines":
+        print(benchmark_engines(args.n_rows))
+    else:
+        benchmark_scaling(args.sizes, args.chunksize)
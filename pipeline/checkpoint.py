@@ -0,0 +1,95 @@
+from pandas import DataFrame, read_parquet
+from hashlib import blake2b
+from glob import glob
+from os import makedirs, remove, replace
+from os.path import exists, join, abspath
+from typing import Dict, List
+import json
+
+import data_import_clean
+
+
+# Configuration each checkpointed stage depends on, besides the output of the stage before it.
+read_stage_config = ["db_select_columns", "db_rename_columns", "db_unique_departments"]
+clean_stage_config = [
+    "binary_qs_variables_name", "convert_to_int_variables", "convert_to_float_variables",
+    "numeric_noise_pattern", "repeated_dot_pattern", "processed_crop_whitelist", "cleaned_schema_version"
+]
+
+
+def file_content_hash(file_path:str, block_size:int=1 << 20) -> str:
+    """
+    blake2b hash of the bytes of `file_path`, read `block_size` bytes at a time.
+    """
+    file_hash = blake2b(digest_size=16)
+    with open(file_path, "rb") as source_file:
+        for block in iter(lambda: source_file.read(block_size), b""):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+def stage_key(previous_key:str, config_names:List[str], **extra) -> str:
+    """
+    Hash of the key of the previous stage, the `config_names` lists of `data_import_clean` and
+    any `extra` settings. A change to any of them invalidates the stage and every stage after it.
+    """
+    config = {name: getattr(data_import_clean, name) for name in config_names}
+    payload = json.dumps({"previous_key": previous_key, "config": config, "extra": extra}, sort_keys=True)
+    return blake2b(payload.encode(), digest_size=16).hexdigest()
+
+
+def checkpoint_path(checkpoint_dir:str, stage_name:str, key:str, frame_name:str) -> str:
+    """ """
+    return join(checkpoint_dir, f"{stage_name}_{frame_name}_{key}.parquet")
+
+
+def load_checkpoint(checkpoint_dir:str, stage_name:str, key:str, frame_names:List[str]) -> Dict[str, DataFrame]:
+    """
+    Frames saved by `save_checkpoint` for `key`, None when the stage has to be run again.
+    """
+    paths = {name: checkpoint_path(checkpoint_dir, stage_name, key, name) for name in frame_names}
+    if not all(exists(path) for path in paths.values()):
+        return None
+    return {name: read_parquet(path) for name, path in paths.items()}
+
+
+def save_checkpoint(checkpoint_dir:str, stage_name:str, key:str, frames:Dict[str, DataFrame]):
+    """
+    Save the output frames of a stage as Parquet. Each file is written under a temporary name
+    and renamed, so an interrupted run never leaves a checkpoint that looks complete. Older
+    checkpoints of the stage are removed.
+    """
+    makedirs(checkpoint_dir, exist_ok=True)
+    for name, frame in frames.items():
+        path = checkpoint_path(checkpoint_dir, stage_name, key, name)
+        frame.to_parquet(f"{path}.tmp", index=True)
+        replace(f"{path}.tmp", path)
+
+    for name in frames:
+        for old_path in glob(checkpoint_path(checkpoint_dir, stage_name, "*", name)):
+            if old_path != checkpoint_path(checkpoint_dir, stage_name, key, name):
+                remove(old_path)
+
+
+def load_marker_path(checkpoint_dir:str, database_path:str) -> str:
+    """ """
+    database_hash = blake2b(abspath(database_path).encode(), digest_size=8).hexdigest()
+    return join(checkpoint_dir, f"loaded_{database_hash}.json")
+
+
+def is_already_loaded(checkpoint_dir:str, database_path:str, key:str) -> bool:
+    """
+    True when the output of `key` was the last thing loaded into `database_path`.
+    """
+    marker_path = load_marker_path(checkpoint_dir, database_path)
+    if not exists(marker_path) or not exists(database_path):
+        return False
+    with open(marker_path) as marker_file:
+        return json.load(marker_file)["key"] == key
+
+
+def mark_as_loaded(checkpoint_dir:str, database_path:str, key:str):
+    """ """
+    makedirs(checkpoint_dir, exist_ok=True)
+    with open(load_marker_path(checkpoint_dir, database_path), "w") as marker_file:
+        json.dump({"database_path": abspath(database_path), "key": key}, marker_file)
@@ -1,8 +1,10 @@
-from pandas import DataFrame, read_csv, Series, concat
-from numpy import where
-# from polars import read_csv, col
+from pandas import DataFrame, read_csv, Series, concat, to_numeric, CategoricalDtype
+from numpy import where, isnan, floor, empty, zeros, column_stack, nonzero, array, iinfo
 from string import punctuation
-from typing import List, Tuple, Dict
+from re import escape
+from typing import List, Tuple, Dict, Iterator
+
+from pipeline_timing import time_stage
 
 
 # variables 
@@ -39,89 +41,326 @@ binary_qs_variables_name = [
     "use_of_organic_fertilizers_by_women"
 ]
 
+# Punctuation stripped from string numerics, "." is kept as the decimal point.
+numeric_noise_pattern = f"[{escape(''.join(punt for punt in punctuation if punt != '.'))}]"
+repeated_dot_pattern = r"\.+"
 
-def read_select_variables(
+processed_crop_whitelist = ["cotton", "yam", "cocoa", "cassava"]
+
+# Compact types of the cleaned data, see `compact_dtypes`. The categories are fixed so every
+# load (and every chunk) has the same DuckDB ENUM types.
+department_dtype = CategoricalDtype([department.replace("DEPARTURE. ", " ").strip() for department in db_unique_departments])
+gender_dtype = CategoricalDtype(["Male", "Female"])
+compact_int_dtypes = {
+    **{binary_variable: "int8" for binary_variable in binary_qs_variables_name},
+    "number_of_products_processed": "int16",
+    "number_of_roots_and_tubers_used": "int16",
+    "number_of_industrial_crops_grown": "int32"
+}
+
+# Bit of each binary answer in `binary_answers_mask`, see `pack_binary_answers`.
+binary_answers_bits = {binary_variable: bit for bit, binary_variable in enumerate(binary_qs_variables_name)}
+
+# Version of the cleaned output (2: compact dtypes, 3: `binary_answers_mask`). Bump it whenever
+# the cleaning code changes its output, checkpoints of older versions are then not reused.
+cleaned_schema_version = 3
+
+
+def read_select_variables_with_report(
         file_path:str, 
         db_select_variables:List[str], 
         db_rename_variables:List[str],
-        db_unq_departments:List[str]
-) -> DataFrame:
-    """ """
+        db_unq_departments:List[str],
+        quarantine_path:str=None
+) -> Tuple[DataFrame, Dict]:
+    """ 
+    Read the selected variables from `file_path` once and return them with a report of the
+    checks. Rows from unknown departments are quarantined (saved to `quarantine_path` when
+    given) and failed checks are recorded in the report, the file is never read a second time.
+    """
+    report = {
+        "file_path": file_path,
+        "error": False,
+        "errors": [],
+        "missing_columns": [],
+        "n_rows_read": 0,
+        "n_rows_selected": 0,
+        "n_rows_quarantined": 0,
+        "quarantined_departments": {},
+        "quarantine_path": None
+    }
 
     try:
         db_data = read_csv(file_path, usecols=db_select_variables)[db_select_variables]
-        db_data.columns = [str(col).strip().lower().replace(" ", "_") for col in db_rename_variables]
-        db_data = db_data.query(f"department in {db_unq_departments}") # -========================== /!\
-
-        # Check number of rows
-        if db_data.shape[0] < 1:
-            raise ValueError("Data Can not have zero rows")
-        # Check number of columns
-        if db_data.shape[1] < 24:
-            raise ValueError("Data Can not have less than 24 columns")
-        
     except ValueError as e:
-        print(e)
-        db_data = read_csv(file_path)
+        # Only the header is needed to find out which selected columns are missing.
+        header = read_csv(file_path, nrows=0).columns
+        report["missing_columns"] = [col for col in db_select_variables if col not in header]
+        report["errors"].append(str(e))
+        report["error"] = True
+        return DataFrame(), report
+
+    db_data.columns = [str(col).strip().lower().replace(" ", "_") for col in db_rename_variables]
+    report["n_rows_read"] = db_data.shape[0]
+
+    department_mask = db_data["department"].isin(db_unq_departments)
+    quarantined = db_data.loc[~department_mask]
+    db_data = db_data.loc[department_mask]
+
+    report["n_rows_selected"] = db_data.shape[0]
+    report["n_rows_quarantined"] = quarantined.shape[0]
+    if quarantined.shape[0] > 0:
+        report["quarantined_departments"] = {
+            str(key): int(value) for key, value in quarantined["department"].value_counts(dropna=False).items()
+        }
+        if quarantine_path is not None:
+            quarantined.to_csv(quarantine_path, index=False)
+            report["quarantine_path"] = quarantine_path
+
+    # Check number of rows
+    if db_data.shape[0] < 1:
+        report["errors"].append("Data Can not have zero rows")
+    # Check number of columns
+    if db_data.shape[1] < 24:
+        report["errors"].append("Data Can not have less than 24 columns")
+    report["error"] = len(report["errors"]) > 0
+
+    return db_data, report
+
+
+def read_select_variables(
+        file_path:str, 
+        db_select_variables:List[str], 
+        db_rename_variables:List[str],
+        db_unq_departments:List[str],
+        quarantine_path:str=None,
+        read_report:Dict=None
+) -> DataFrame:
+    """ 
+    See `read_select_variables_with_report`, the report is printed when a check fails or rows
+    were quarantined. A `read_report` dict is updated with it, for the number of rows read.
+    """
+    db_data, report = read_select_variables_with_report(
+        file_path, db_select_variables, db_rename_variables, db_unq_departments, quarantine_path
+    )
+    if report["error"] or report["n_rows_quarantined"] > 0:
+        print(report)
+    if read_report is not None:
+        read_report.update(report)
 
     return db_data
 
 
+def read_select_variables_chunked(
+        file_path:str, 
+        db_select_variables:List[str], 
+        db_rename_variables:List[str],
+        db_unq_departments:List[str],
+        chunksize:int=100_000,
+        quarantine_path:str=None,
+        read_report:Dict=None
+) -> Iterator[DataFrame]:
+    """ 
+    Stream `file_path` in chunks of `chunksize` rows instead of loading it in one shot.
+    The column selection, renaming and department filter are applied to every chunk, so
+    only one chunk is held in memory at a time. Rows from unknown departments are appended
+    to `quarantine_path` when given. The rows read so far are counted in the "n_rows_read"
+    of `read_report` when given.
+    """
+    rename_variables = [str(col).strip().lower().replace(" ", "_") for col in db_rename_variables]
+    quarantine_header = True
+
+    with read_csv(file_path, usecols=db_select_variables, chunksize=chunksize) as reader:
+        for chunk in reader:
+            if read_report is not None:
+                read_report["n_rows_read"] = read_report.get("n_rows_read", 0) + chunk.shape[0]
+            chunk = chunk[db_select_variables]
+            chunk.columns = rename_variables
+            department_mask = chunk["department"].isin(db_unq_departments)
+
+            if quarantine_path is not None and not department_mask.all():
+                chunk.loc[~department_mask].to_csv(
+                    quarantine_path, index=False, mode="w" if quarantine_header else "a", header=quarantine_header
+                )
+                quarantine_header = False
+
+            chunk = chunk.loc[department_mask]
+
+            if chunk.shape[0] > 0:
+                yield chunk
+
+
+def read_male_gender_code(
+        file_paths:List[str], 
+        db_select_variables:List[str], 
+        db_rename_variables:List[str],
+        db_unq_departments:List[str],
+        chunksize:int=100_000,
+        read_report:Dict=None
+) -> int:
+    """ 
+    Cheap first pass over the department and gender columns of `file_paths`: the most frequent
+    gender code of the kept rows of every file whose genders are coded as integers, None if there
+    is none. Chunked and multi-file runs pass it to `clean_variables` so every chunk and every
+    file maps the codes the same way. The rows read are counted in the "n_rows_read" of
+    `read_report` when given.
+    """
+    rename_variables = [str(col).strip().lower().replace(" ", "_") for col in db_rename_variables]
+    department_col = db_select_variables[rename_variables.index("department")]
+    gender_col = db_select_variables[rename_variables.index("gender_of_head_of_household")]
+
+    # Counts in order of first appearance, like `value_counts` on the whole file.
+    gender_counts = {}
+    for file_path in file_paths:
+        file_counts = {}
+        with read_csv(file_path, usecols=[department_col, gender_col], chunksize=chunksize) as reader:
+            for chunk in reader:
+                if read_report is not None:
+                    read_report["n_rows_read"] = read_report.get("n_rows_read", 0) + chunk.shape[0]
+                genders = chunk.loc[chunk[department_col].isin(db_unq_departments), gender_col]
+                if genders.dtype != "int64":
+                    # `clean_variables` does not use the code for this file.
+                    file_counts = {}
+                    break
+                for code, count in genders.value_counts(sort=False).items():
+                    file_counts[code] = file_counts.get(code, 0) + count
+
+        for code, count in file_counts.items():
+            gender_counts[code] = gender_counts.get(code, 0) + count
+
+    if len(gender_counts) == 0:
+        return None
+    return max(gender_counts, key=gender_counts.get)
+
 
 def handle_binary_variable(df:DataFrame, db_variable:str) -> Series:
-    """ """
-    func_df = df.copy()
+    """ 
+    Only the `db_variable` column is converted, `df` is not copied.
+    """
+    column = df[db_variable]
 
     try:
-        if func_df[db_variable].dtype == "bool":
-            func_df[db_variable] = func_df[db_variable].astype("int64")
-
-        elif func_df[db_variable].dtype == "int64":
-            if func_df[db_variable].nunique() == 2 and all(func_df[db_variable].unique() == [1, 2]):
-                func_df[db_variable] = where(func_df[db_variable] == 2, 0, 1)
+        if column.dtype == "bool":
+            column = column.astype("int64")
+
+        elif column.dtype == "int64":
+            # A chunk may only contain one of the two codes, so check for a subset.
+            unique_values = set(column.unique())
+            if unique_values <= {1, 2}:
+                column = Series(where(column == 2, 0, 1), index=column.index, name=db_variable)
             else:
-                if func_df[db_variable].nunique() > 2:
+                if len(unique_values) > 2:
                     raise ValueError(f"There are more than 2 unique values in {db_variable}. expectes 2")
                 
-                if not all(func_df[db_variable].unique() == [1, 2]):
+                if not unique_values <= {0, 1}:
                     raise ValueError(f"Unknow binary coding for {db_variable} expected [1, 2] or [0, 1]")
         
-        return func_df[db_variable]
+        return column
     except ValueError as e:
         print(e)
-        return func_df[db_variable]
+        return column
 
 
 def convert_string_to_numeric(df:DataFrame, db_variable:str, convert_int:bool=True) -> Series:
-    """ """
-    func_df = df.copy()
+    """ 
+    Only the `db_variable` column is converted, `df` is not copied.
+    """
+    column = df[db_variable]
 
     try:
-        if func_df[db_variable].dtype == "O":
+        if column.dtype == "O":
             for punt in punctuation:
                 if punt == '.':
-                    func_df[db_variable] = func_df[db_variable].str.replace(r"\.+", ".")
+                    column = column.str.replace(r"\.+", ".")
                 else:
-                    func_df[db_variable] = func_df[db_variable].str.replace(punt, "")
+                    column = column.str.replace(punt, "")
 
             if convert_int:
-                func_df[db_variable] = func_df[db_variable].astype("int64")
+                column = column.astype("int64")
             else:
-                func_df[db_variable] = func_df[db_variable].astype("float64")
+                column = column.astype("float64")
         
-        return func_df[db_variable]
+        return column
     except ValueError as e:
         print(e)
-        return func_df[db_variable]
+        return column
+
+
+def coerce_numeric_variables(
+        df:DataFrame, 
+        db_conv_int_variables:List[str],
+        db_conv_float_variables:List[str],
+        block_size:int=1_000_000
+) -> Tuple[Dict[str, Series], Dict[str, int]]:
+    """ 
+    Clean and cast every string column in `db_conv_int_variables` and `db_conv_float_variables`
+    in one pass. The string columns are stacked into a single Series so the punctuation is
+    removed with one regex and the values are parsed in one call, instead of one `str.replace`
+    per punctuation character and per column as in `convert_string_to_numeric`.
+
+    Returns the converted columns and the number of values in each that failed to convert.
+    Integer columns with failed values are returned as float64.
+    """
+    target_variables = list(db_conv_int_variables) + list(db_conv_float_variables)
+    string_variables = [col for col in target_variables if df[col].dtype == "O"]
+    n_rows = df.shape[0]
+
+    converted = {col: df[col] for col in target_variables}
+    failed_counts = {col: 0 for col in target_variables}
+
+    if len(string_variables) > 0:
+        stacked = concat([df[col] for col in string_variables], ignore_index=True)
+        values = empty(stacked.shape[0], dtype="float64")
+
+        # The cleaned strings are only needed until they are parsed, so they are built one block
+        # at a time to keep them from doubling the memory held by the string columns.
+        for start in range(0, stacked.shape[0], block_size):
+            cleaned = stacked.iloc[start:start+block_size].str.replace(numeric_noise_pattern, "", regex=True)
+
+            # Only the few values with repeated dots need the second regex.
+            repeated_dots = cleaned.str.contains("..", regex=False, na=False).to_numpy(dtype="bool")
+            if repeated_dots.any():
+                cleaned[repeated_dots] = cleaned[repeated_dots].str.replace(repeated_dot_pattern, ".", regex=True)
+
+            try:
+                # Fast path when every value parses, `to_numeric` is only needed to coerce failures.
+                values[start:start+block_size] = cleaned.astype("float64").to_numpy()
+            except ValueError:
+                values[start:start+block_size] = to_numeric(cleaned, errors="coerce").to_numpy(dtype="float64")
+            del cleaned
+
+        failed = isnan(values) & stacked.notna().to_numpy()
+
+        for position, col in enumerate(string_variables):
+            col_values = values[position*n_rows:(position+1)*n_rows]
+            col_failed = failed[position*n_rows:(position+1)*n_rows]
+
+            if col in db_conv_int_variables:
+                # Fractions can not be stored as integers.
+                col_failed = col_failed | ((col_values != floor(col_values)) & ~isnan(col_values))
+                col_values = col_values.copy()
+                col_values[col_failed] = float("nan")
+
+            failed_counts[col] = int(col_failed.sum())
+            if col in db_conv_int_variables and not isnan(col_values).any():
+                col_values = col_values.astype("int64")
+
+            converted[col] = Series(col_values, index=df.index, name=col)
+
+    return converted, failed_counts
     
 
 def clean_variables(
         df:DataFrame, 
         db_binary_variables:List[str],
         db_conv_int_variables:List[str],
-        db_conv_float_variables:List[str]
+        db_conv_float_variables:List[str],
+        male_gender_code:int=None
 ) -> DataFrame:
-    """ """
+    """ 
+    Integer gender codes are mapped with `male_gender_code` as "Male" when given, otherwise
+    with the most frequent code of `df`.
+    """
 
     try:
         # Clean department variable
@@ -131,83 +370,102 @@ def clean_variables(
         # ...
 
         # Clean gender column
-        if df['gender_of_head_of_household'].dtypes == "O" and df['gender_of_head_of_household'].nunique() == 2:
+        if df['gender_of_head_of_household'].dtypes == "O" and df['gender_of_head_of_household'].nunique() <= 2:
             df['gender_of_head_of_household'] = where(
                 df['gender_of_head_of_household'].isin(["M", "m", "male"]), "Male", "Female"
             )
         elif df['gender_of_head_of_household'].dtypes == "int64":
-            male_value = df["gender_of_head_of_household"].value_counts(sort=True).index[0]
+            male_value = male_gender_code
+            if male_value is None:
+                male_value = df["gender_of_head_of_household"].value_counts(sort=True).index[0]
             df['gender_of_head_of_household'] = where(df['gender_of_head_of_household'] == male_value, "Male", "Female")
         # Check cleaned output
-        if not all(value in list(df["gender_of_head_of_household"].unique()) for value in ["Male", "Female"]):
+        if not set(df["gender_of_head_of_household"].unique()) <= {"Male", "Female"}:
             raise ValueError("`gender_of_head_of_household` variable cleaning failed...")
         
         # Handle water source values
         df["source_of_irrigation_water_used"] = df["source_of_irrigation_water_used"].fillna("NA")
         # Check cleaned output
-        if df["source_of_irrigation_water_used"].fillna("NA").isnull().sum() > 1:
+        if df["source_of_irrigation_water_used"].isnull().sum() > 0:
             raise ValueError(f"failed to fill `source_of_irrigation_water_used` variable missing values")
         
         # Handle Binary Columns
         for binary_cols in db_binary_variables:
             df[binary_cols] = handle_binary_variable(df, binary_cols)
             # Check cleaned output
-            if not all(df[binary_cols].unique() == [1, 0]):
+            if not set(df[binary_cols].unique()) <= {1, 0}:
                 raise ValueError(f"{binary_cols} variable failed to convert to binary [1, 0]")
 
         # string to numeric:
+        numeric_columns, failed_counts = coerce_numeric_variables(df, db_conv_int_variables, db_conv_float_variables)
+        for num_cols, num_values in numeric_columns.items():
+            df[num_cols] = num_values
+
+        # Check cleaned output
+        # Failed values are NaN, which a float column holds without changing dtype, so the
+        # counts are checked for every column. Same message as `duckdb_ingest.check_failed_conversions`.
+        failed_variables = {col: n_failed for col, n_failed in failed_counts.items() if n_failed > 0}
+        if len(failed_variables) > 0:
+            raise ValueError(
+                "Variables failed to convert: " + ", ".join(f"{col} ({n_failed} values)" for col, n_failed in failed_variables.items())
+            )
+
         # To Integer
         for int_cols in db_conv_int_variables:
-            df[int_cols] = convert_string_to_numeric(df=df, db_variable=int_cols, convert_int=True)
-        # Check cleaned output
             if not df[int_cols].dtype == "int64":
-                raise ValueError(f"{int_cols} variable failed to convert to Integer")
+                raise ValueError(f"{int_cols} variable failed to convert to Integer ({failed_counts[int_cols]} values)")
 
         # To Float
         for float_cols in db_conv_float_variables:
-            df[float_cols] = convert_string_to_numeric(df=df, db_variable=float_cols, convert_int=False)
-        # Check cleaned output
             if not df[float_cols].dtype == "float64":
-                raise ValueError(f"{float_cols} variable failed to convert to Float")
+                raise ValueError(f"{float_cols} variable failed to convert to Float ({failed_counts[float_cols]} values)")
             
         return df
+    except ValueError:
+        # Carries the number of values that failed to convert, the caller reports it.
+        raise
     except:
         return df
     
 
 
 def tranform_processed_products_long(df:DataFrame) -> DataFrame:
-    """ """
+    """ 
+    One row per household and product slot with the crop name and code, for the crops in
+    `processed_crop_whitelist`. The whitelist is applied to the wide name columns, so only the
+    selected cells are gathered into the long table.
+    """
     try:
         code_variables = [col for col in df.columns if "processed_product_code" in col or "transformed_product_code" in col]
         name_variables = [col for col in df.columns if "processed_product_name" in col]
 
-        df_name = df[['household_id']+name_variables].melt(
-            id_vars=["household_id"], value_vars=name_variables, var_name="var_name", value_name="crop_name"
-        ).rename(columns={"household_id": "household_id_name"})
-
-        df_code = df[['household_id']+code_variables].melt(
-            id_vars=["household_id"], value_vars=code_variables, var_name="var_code", value_name="crop_code"
-        ).rename(columns={"household_id": "household_id_code"})
-
-        fun_df = concat([df_name, df_code], axis=1)
-
-        # Checks 
-        check = (
-            fun_df
-            .assign(check = lambda _: _["var_code"].str.split("_", expand=True)[3] == _["var_name"].str.split("_", expand=True)[3]) 
-            .query("household_id_code == household_id_name and check")
-        ).shape[0] == df.shape[0] * 4
+        # Checks: every name variable must have a code variable for the same product slot.
+        check = len(name_variables) == len(code_variables) and all(
+            name_col.split("_")[3] == code_col.split("_")[3] for name_col, code_col in zip(name_variables, code_variables)
+        )
 
         if check:
-            fun_df = (
-                fun_df
-                .drop(["household_id_code", "var_code"], axis=1)
-                .rename(columns={'household_id_name': 'household_id', 'var_name': 'product'})
-                .assign(crop_code = lambda _: "0" + _['crop_code'].astype("str"))
-            )
             # Select only choosen crops. 
-            fun_df = fun_df.loc[fun_df["crop_name"].str.lower().isin(["cotton", "yam", "cocoa", "cassava"])]
+            # Slots that are empty in every row are read as float, hence the cast to string.
+            keep = column_stack([
+                df[name_col].astype("string").str.lower().isin(processed_crop_whitelist).to_numpy(dtype=bool)
+                for name_col in name_variables
+            ])
+            # Slot-major order, like stacking one slot after another.
+            slots, rows = nonzero(keep.T)
+
+            names = df[name_variables].to_numpy()[rows, slots]
+            codes = df[code_variables].to_numpy()[rows, slots]
+
+            fun_df = DataFrame(
+                {
+                    "household_id": df["household_id"].to_numpy()[rows],
+                    "product": array(name_variables, dtype="O")[slots],
+                    "crop_name": names,
+                    "crop_code": "0" + Series(codes).astype("str").to_numpy(dtype="O")
+                },
+                index=slots * df.shape[0] + rows
+            )
             return fun_df
         
         else:
@@ -218,16 +476,76 @@ def tranform_processed_products_long(df:DataFrame) -> DataFrame:
     
 
 
-def run_cleaning_transformation_process(imp_data:DataFrame, **kwargs) -> Tuple[DataFrame, DataFrame]:
-    """ """
+def compact_dtypes(df:DataFrame) -> DataFrame:
+    """ 
+    Store the cleaned data with compact types: categoricals (DuckDB ENUMs) for `department` and
+    `gender_of_head_of_household` and small integers for the binary answers and counts.
+    `source_of_irrigation_water_used` stays a string, its values are not known in advance.
+    Raises a ValueError instead of silently losing values that do not fit.
+    """
+    for col, dtype in [("department", department_dtype), ("gender_of_head_of_household", gender_dtype)]:
+        compact_col = df[col].astype(dtype)
+        if compact_col.isnull().sum() > df[col].isnull().sum():
+            raise ValueError(f"`{col}` has values outside of {list(dtype.categories)}")
+        df[col] = compact_col
+
+    for col, dtype in compact_int_dtypes.items():
+        if col not in df.columns:
+            continue
+        if df[col].dtype.kind not in "iu":
+            raise ValueError(f"`{col}` must be an integer column to be stored as {dtype}")
+        if df.shape[0] > 0 and (df[col].min() < iinfo(dtype).min or df[col].max() > iinfo(dtype).max):
+            raise ValueError(f"`{col}` has values that do not fit in {dtype}")
+        df[col] = df[col].astype(dtype)
+
+    return df
+
+
+def pack_binary_answers(df:DataFrame) -> DataFrame:
+    """ 
+    Add `binary_answers_mask`, the seven cleaned binary answers of a household packed into one
+    uint8 with bit `binary_answers_bits[variable]` set for each "yes".
+    """
+    mask = zeros(df.shape[0], dtype="uint8")
+    for binary_variable, bit in binary_answers_bits.items():
+        mask |= (df[binary_variable].to_numpy() == 1).astype("uint8") << bit
+
+    df["binary_answers_mask"] = mask
+    return df
+
+
+def run_cleaning_transformation_process(
+        imp_data:DataFrame, 
+        timing_report:Dict=None, 
+        **kwargs
+) -> Tuple[DataFrame, DataFrame]:
+    """ 
+    When a `timing_report` from `pipeline_timing.new_timing_report` is given, the cleaning and
+    the transformation are recorded as separate stages.
+    """
 
     # Clean and check  data
-    df = clean_variables(imp_data, **kwargs)
+    with time_stage(timing_report, "clean_variables", rows_in=imp_data.shape[0]) as stage:
+        df = clean_variables(imp_data, **kwargs)
+        stage["rows_out"] = df.shape[0]
 
     # Extract product code and name
-    product_code_name = tranform_processed_products_long(df)
+    with time_stage(timing_report, "tranform_processed_products_long", rows_in=df.shape[0]) as stage:
+        product_code_name = tranform_processed_products_long(df)
+        stage["rows_out"] = product_code_name.shape[0]
 
     # Drop product name and code from cleaned data
     df = df.drop([col for col in df.columns if "processed_product" in col or "transformed_product_code" in col], axis=1)
 
-    return df, product_code_name
\ No newline at end of file
+    return pack_binary_answers(compact_dtypes(df)), product_code_name
+
+
+def run_chunked_cleaning_transformation_process(
+        imp_chunks:Iterator[DataFrame], 
+        **kwargs
+) -> Iterator[Tuple[DataFrame, DataFrame]]:
+    """ 
+    Clean and transform each chunk from `read_select_variables_chunked` as it arrives.
+    """
+    for chunk in imp_chunks:
+        yield run_cleaning_transformation_process(chunk, **kwargs)
\ No newline at end of file
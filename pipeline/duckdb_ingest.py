@@ -0,0 +1,259 @@
+import duckdb
+from typing import List, Tuple
+
+from data_import_clean import (
+    numeric_noise_pattern, 
+    repeated_dot_pattern, 
+    processed_crop_whitelist,
+    department_dtype,
+    gender_dtype,
+    compact_int_dtypes
+)
+from save_read_table import refresh_department_kpis, binary_answers_mask_sql
+
+
+def sql_string(value:str) -> str:
+    """
+    Quote `value` as a SQL string literal.
+    """
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def sql_string_list(values:List[str]) -> str:
+    """ """
+    return ", ".join(sql_string(value) for value in values)
+
+
+def product_name_code_variables(db_columns:List[str]) -> Tuple[List[str], List[str]]:
+    """
+    Processed product name and code variables, in the same order as `tranform_processed_products_long`.
+    """
+    code_variables = [col for col in db_columns if "processed_product_code" in col or "transformed_product_code" in col]
+    name_variables = [col for col in db_columns if "processed_product_name" in col]
+
+    return name_variables, code_variables
+
+
+def build_cleaning_select_sql(
+        file_path:str,
+        db_select_variables:List[str],
+        db_rename_variables:List[str],
+        db_unq_departments:List[str],
+        db_binary_variables:List[str],
+        db_conv_int_variables:List[str],
+        db_conv_float_variables:List[str]
+) -> str:
+    """
+    SQL version of `read_select_variables` and `clean_variables`.
+
+    The file is read with DuckDB's CSV reader, only `db_select_variables` are scanned and the
+    department filter is applied in the scan. Every column is read as VARCHAR so string
+    numerics are cleaned the same way whatever type the reader would have guessed.
+
+    Each binary and numeric column gets a `<column>_failed` flag, true when a value was given
+    but could not be converted, checked by `check_failed_conversions`.
+    """
+    rename_variables = [str(col).strip().lower().replace(" ", "_") for col in db_rename_variables]
+
+    projection = ",\n            ".join(
+        f'"{select_col}" AS {rename_col}' for select_col, rename_col in zip(db_select_variables, rename_variables)
+    )
+    department_variable = db_select_variables[rename_variables.index("department")]
+
+    cleaned_columns = []
+    for col in rename_variables:
+        if col == "department":
+            expression = "trim(replace(department, 'DEPARTURE. ', ' '))"
+        elif col == "gender_of_head_of_household":
+            # Integer codes are kept for now and recoded by `recode_integer_gender`.
+            expression = f"""CASE
+                WHEN {col} IN ('M', 'm', 'male') THEN 'Male'
+                WHEN regexp_full_match({col}, '\\d+') THEN {col}
+                ELSE 'Female'
+            END"""
+        elif col == "source_of_irrigation_water_used":
+            expression = f"coalesce({col}, 'NA')"
+        elif col in db_binary_variables:
+            expression = f"""CAST(CASE
+                WHEN {col} IN ('1', 'True', 'true') THEN 1
+                WHEN {col} IN ('0', '2', 'False', 'false') THEN 0
+            END AS BIGINT)"""
+        elif col in db_conv_int_variables or col in db_conv_float_variables:
+            sql_type = "BIGINT" if col in db_conv_int_variables else "DOUBLE"
+            expression = (
+                f"TRY_CAST(regexp_replace(regexp_replace({col}, {sql_string(numeric_noise_pattern)}, '', 'g'), "
+                f"{sql_string(repeated_dot_pattern)}, '.', 'g') AS {sql_type})"
+            )
+        else:
+            expression = col
+        cleaned_columns.append(f"{expression} AS {col}")
+
+        if col in db_binary_variables or col in db_conv_int_variables or col in db_conv_float_variables:
+            cleaned_columns.append(f"({col} IS NOT NULL AND {expression} IS NULL) AS {col}_failed")
+
+    cleaned_projection = ",\n        ".join(cleaned_columns)
+
+    return f"""
+    WITH source AS (
+        SELECT
+            {projection}
+        FROM read_csv({sql_string(file_path)}, header=true, all_varchar=true)
+        WHERE "{department_variable}" IN ({sql_string_list(db_unq_departments)})
+    )
+    SELECT
+        {cleaned_projection}
+    FROM source
+    """
+
+
+def check_failed_conversions(
+        conn:duckdb.DuckDBPyConnection,
+        table_name:str,
+        checked_variables:List[str],
+        required_variables:List[str]
+):
+    """
+    Raise a ValueError with the number of values of each column that could not be converted,
+    like `clean_variables`, instead of loading them as NULLs. The `required_variables` can not
+    have missing values either, `clean_variables` stores the binary and integer columns as int64.
+    """
+    failed_counts = conn.execute(
+        "SELECT " + ", ".join(f"count(*) FILTER (WHERE {col}_failed)" for col in checked_variables) + f" FROM {table_name}"
+    ).fetchone()
+    failed_counts = {col: n_failed for col, n_failed in zip(checked_variables, failed_counts) if n_failed > 0}
+
+    if len(failed_counts) > 0:
+        raise ValueError(
+            "Variables failed to convert: " + ", ".join(f"{col} ({n_failed} values)" for col, n_failed in failed_counts.items())
+        )
+
+    missing_counts = conn.execute(
+        "SELECT " + ", ".join(f"count(*) FILTER (WHERE {col} IS NULL)" for col in required_variables) + f" FROM {table_name}"
+    ).fetchone()
+    missing_counts = {col: n_missing for col, n_missing in zip(required_variables, missing_counts) if n_missing > 0}
+
+    if len(missing_counts) > 0:
+        raise ValueError(
+            "Variables have missing values: " + ", ".join(f"{col} ({n_missing} values)" for col, n_missing in missing_counts.items())
+        )
+
+
+def compact_column_sql(col:str) -> str:
+    """
+    SQL version of `compact_dtypes` for one column. Unlike the TRY_CASTs of the cleaning the
+    casts are strict, values that do not fit fail the load.
+    """
+    sql_int_types = {"int8": "TINYINT", "int16": "SMALLINT", "int32": "INTEGER"}
+
+    if col == "department":
+        return f"CAST({col} AS ENUM({sql_string_list(department_dtype.categories)})) AS {col}"
+    if col == "gender_of_head_of_household":
+        return f"CAST({col} AS ENUM({sql_string_list(gender_dtype.categories)})) AS {col}"
+    if col in compact_int_dtypes:
+        return f"CAST({col} AS {sql_int_types[compact_int_dtypes[col]]}) AS {col}"
+    return col
+
+
+def recode_integer_gender(conn:duckdb.DuckDBPyConnection, table_name:str):
+    """
+    Integer coded genders use the most frequent code as male, like `clean_variables`.
+    """
+    col = "gender_of_head_of_household"
+    is_integer_coded = conn.execute(
+        f"SELECT count(*) > 0 FROM {table_name} WHERE {col} NOT IN ('Male', 'Female')"
+    ).fetchone()[0]
+
+    if is_integer_coded:
+        conn.execute(f"""
+            UPDATE {table_name}
+            SET {col} = CASE WHEN {col} = (SELECT mode({col}) FROM {table_name}) THEN 'Male' ELSE 'Female' END
+        """)
+
+
+def build_products_long_sql(source_table:str, db_columns:List[str]) -> str:
+    """
+    SQL version of `tranform_processed_products_long`, the crop filter is applied per product slot.
+    """
+    name_variables, code_variables = product_name_code_variables(db_columns)
+
+    slots = "\n    UNION ALL\n    ".join(
+        f"""SELECT household_id, {sql_string(name_col)} AS product, {name_col} AS crop_name,
+        '0' || CAST({code_col} AS VARCHAR) AS crop_code
+    FROM {source_table}
+    WHERE lower({name_col}) IN ({sql_string_list(processed_crop_whitelist)})"""
+        for name_col, code_col in zip(name_variables, code_variables)
+    )
+    return slots
+
+
+def ingest_csv_with_duckdb(
+        new_database_path:str,
+        file_path:str,
+        cleaned_data_table_name:str,
+        prod_name_code_table_name:str,
+        db_select_variables:List[str],
+        db_rename_variables:List[str],
+        db_unq_departments:List[str],
+        db_binary_variables:List[str],
+        db_conv_int_variables:List[str],
+        db_conv_float_variables:List[str],
+        kpi_table_name:str=None
+) -> Tuple[int, int]:
+    """
+    Read, clean and save the survey data without going through pandas.
+
+    Creates the same tables as `run_cleaning_transformation_process` followed by `save_data_to_database`
+    and returns the number of rows in each.
+    """
+    rename_variables = [str(col).strip().lower().replace(" ", "_") for col in db_rename_variables]
+    product_variables = [col for col in rename_variables if "processed_product" in col or "transformed_product_code" in col]
+    cleaned_variables = [col for col in rename_variables if col not in product_variables]
+
+    cleaning_sql = build_cleaning_select_sql(
+        file_path,
+        db_select_variables,
+        db_rename_variables,
+        db_unq_departments,
+        db_binary_variables,
+        db_conv_int_variables,
+        db_conv_float_variables
+    )
+
+    conn = duckdb.connect(database=new_database_path)
+    try:
+        conn.execute("BEGIN TRANSACTION")
+        conn.execute(f"CREATE TEMP TABLE cleaned_source AS {cleaning_sql}")
+
+        n_rows = conn.execute("SELECT count(*) FROM cleaned_source").fetchone()[0]
+        if n_rows < 1:
+            raise ValueError("Data Can not have zero rows")
+
+        check_failed_conversions(
+            conn,
+            "cleaned_source",
+            [
+                col for col in rename_variables
+                if col in db_binary_variables or col in db_conv_int_variables or col in db_conv_float_variables
+            ],
+            [col for col in rename_variables if col in db_binary_variables or col in db_conv_int_variables]
+        )
+        recode_integer_gender(conn, "cleaned_source")
+
+        conn.execute(f"""
+            CREATE TABLE {cleaned_data_table_name} AS
+            SELECT {", ".join(compact_column_sql(col) for col in cleaned_variables)}, {binary_answers_mask_sql()}
+            FROM cleaned_source
+        """)
+        conn.execute(f"""
+            CREATE TABLE {prod_name_code_table_name} AS
+            {build_products_long_sql("cleaned_source", rename_variables)}
+        """)
+
+        n_prod_rows = conn.execute(f"SELECT count(*) FROM {prod_name_code_table_name}").fetchone()[0]
+        if kpi_table_name is not None:
+            refresh_department_kpis(conn, cleaned_data_table_name, kpi_table_name)
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+    return n_rows, n_prod_rows
@@ -0,0 +1,80 @@
+from contextlib import contextmanager
+from datetime import datetime
+from threading import Event, Thread
+from time import perf_counter, process_time
+from typing import Dict, Iterator
+import json
+
+import psutil
+
+
+def new_timing_report(**run_details) -> Dict:
+    """
+    Empty report for `time_stage`, `run_details` (engine, file path, ...) are saved with it.
+    """
+    return {"run_started_at": datetime.now().isoformat(timespec="seconds"), **run_details, "stages": []}
+
+
+def bytes_written_so_far(process:psutil.Process) -> int:
+    """
+    Bytes written by this process, None where psutil has no I/O counters (macOS).
+    """
+    try:
+        return process.io_counters().write_bytes
+    except (AttributeError, psutil.Error):
+        return None
+
+
+@contextmanager
+def time_stage(report:Dict, stage_name:str, rows_in:int=None, sample_interval:float=0.01) -> Iterator[Dict]:
+    """
+    Record the wall time, CPU time, peak RSS and bytes written of the `with` block as a stage of
+    `report`. The stage dict is yielded so the caller can set "rows_out". Does nothing when
+    `report` is None.
+    """
+    stage = {"stage": stage_name, "rows_in": rows_in, "rows_out": None}
+    if report is None:
+        yield stage
+        return
+
+    process = psutil.Process()
+    peak_rss = process.memory_info().rss
+    stop_sampling = Event()
+
+    def sample_rss():
+        nonlocal peak_rss
+        while not stop_sampling.wait(sample_interval):
+            peak_rss = max(peak_rss, process.memory_info().rss)
+
+    sampler = Thread(target=sample_rss, daemon=True)
+    sampler.start()
+
+    start_bytes = bytes_written_so_far(process)
+    start_wall = perf_counter()
+    start_cpu = process_time()
+    try:
+        yield stage
+    finally:
+        wall_time = perf_counter() - start_wall
+        cpu_time = process_time() - start_cpu
+        end_bytes = bytes_written_so_far(process)
+
+        stop_sampling.set()
+        sampler.join()
+        peak_rss = max(peak_rss, process.memory_info().rss)
+
+        stage.update({
+            "wall_time_s": round(wall_time, 4),
+            "cpu_time_s": round(cpu_time, 4),
+            "peak_rss_mb": round(peak_rss / 1024**2, 1),
+            "bytes_written": None if start_bytes is None or end_bytes is None else end_bytes - start_bytes
+        })
+        report["stages"].append(stage)
+
+
+def write_timing_report(report:Dict, file_path:str):
+    """ """
+    report["total_wall_time_s"] = round(sum(stage["wall_time_s"] for stage in report["stages"]), 4)
+
+    with open(file_path, "w") as report_file:
+        json.dump(report, report_file, indent=2)
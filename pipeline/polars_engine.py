@@ -0,0 +1,165 @@
+import polars as pl
+from pandas import DataFrame
+from typing import List, Tuple
+
+from data_import_clean import (
+    numeric_noise_pattern, 
+    repeated_dot_pattern, 
+    processed_crop_whitelist, 
+    compact_dtypes, 
+    pack_binary_answers
+)
+
+
+def read_select_variables_lazy(
+        file_path:str,
+        db_select_variables:List[str],
+        db_rename_variables:List[str],
+        db_unq_departments:List[str]
+) -> pl.LazyFrame:
+    """
+    Lazy version of `read_select_variables`. Only the selected columns are scanned and the
+    department filter is pushed down into the CSV scan. Every column is read as a string so
+    string numerics are cleaned the same way whatever type would have been inferred.
+    """
+    rename_variables = [str(col).strip().lower().replace(" ", "_") for col in db_rename_variables]
+
+    return (
+        pl.scan_csv(file_path, infer_schema_length=0)
+            .select([pl.col(select_col).alias(rename_col) for select_col, rename_col in zip(db_select_variables, rename_variables)])
+            .filter(pl.col("department").is_in(db_unq_departments))
+    )
+
+
+def clean_variables_lazy(
+        lf:pl.LazyFrame,
+        db_binary_variables:List[str],
+        db_conv_int_variables:List[str],
+        db_conv_float_variables:List[str]
+) -> pl.LazyFrame:
+    """
+    Lazy version of `clean_variables`, all columns are cleaned in a single `with_columns`.
+
+    Each binary and numeric column gets a `<column>_failed` flag, true when a value was given
+    but could not be converted, counted by `check_failed_conversions_lazy`.
+    """
+    gender = pl.col("gender_of_head_of_household")
+
+    cleaning_expressions = [
+        # Clean department variable
+        pl.col("department").str.replace_all("DEPARTURE. ", " ", literal=True).str.strip_chars(),
+
+        # Clean gender column, integer codes use the most frequent code as male.
+        pl.when(gender.is_in(["M", "m", "male"])).then(pl.lit("Male"))
+            .when(gender.str.contains(r"^\d+$") & (gender == gender.mode().first())).then(pl.lit("Male"))
+            .otherwise(pl.lit("Female"))
+            .alias("gender_of_head_of_household"),
+
+        # Handle water source values
+        pl.col("source_of_irrigation_water_used").fill_null("NA")
+    ]
+
+    # Handle Binary Columns
+    for binary_cols in db_binary_variables:
+        value = (
+            pl.when(pl.col(binary_cols).is_in(["1", "True", "true"])).then(1)
+                .when(pl.col(binary_cols).is_in(["0", "2", "False", "false"])).then(0)
+                .cast(pl.Int64)
+        )
+        cleaning_expressions.append(value.alias(binary_cols))
+        cleaning_expressions.append((pl.col(binary_cols).is_not_null() & value.is_null()).alias(f"{binary_cols}_failed"))
+
+    # string to numeric:
+    for num_cols in list(db_conv_int_variables) + list(db_conv_float_variables):
+        value = (
+            pl.col(num_cols)
+                .str.replace_all(numeric_noise_pattern, "")
+                .str.replace_all(repeated_dot_pattern, ".")
+                .cast(pl.Float64, strict=False)
+        )
+        if num_cols in db_conv_int_variables:
+            # Fractions can not be stored as integers.
+            value = pl.when(value == value.floor()).then(value).cast(pl.Int64)
+        cleaning_expressions.append(value.alias(num_cols))
+        cleaning_expressions.append((pl.col(num_cols).is_not_null() & value.is_null()).alias(f"{num_cols}_failed"))
+
+    return lf.with_columns(cleaning_expressions)
+
+
+def check_failed_conversions_lazy(
+        lf:pl.LazyFrame,
+        checked_variables:List[str],
+        required_variables:List[str]
+) -> pl.LazyFrame:
+    """
+    One row counting the values of each checked column that failed to convert and the missing
+    values of each required column, read by `raise_failed_conversions`.
+    """
+    return lf.select(
+        [pl.col(f"{col}_failed").sum().alias(f"{col}_failed") for col in checked_variables]
+        + [pl.col(col).null_count().alias(f"{col}_missing") for col in required_variables]
+    )
+
+
+def raise_failed_conversions(counts:pl.DataFrame, checked_variables:List[str], required_variables:List[str]):
+    """
+    Raise a ValueError like `clean_variables`, same messages as `duckdb_ingest.check_failed_conversions`.
+    """
+    counts = counts.row(0, named=True)
+
+    failed_counts = {col: counts[f"{col}_failed"] for col in checked_variables if counts[f"{col}_failed"] > 0}
+    if len(failed_counts) > 0:
+        raise ValueError(
+            "Variables failed to convert: " + ", ".join(f"{col} ({n_failed} values)" for col, n_failed in failed_counts.items())
+        )
+
+    missing_counts = {col: counts[f"{col}_missing"] for col in required_variables if counts[f"{col}_missing"] > 0}
+    if len(missing_counts) > 0:
+        raise ValueError(
+            "Variables have missing values: " + ", ".join(f"{col} ({n_missing} values)" for col, n_missing in missing_counts.items())
+        )
+
+
+def tranform_processed_products_long_lazy(lf:pl.LazyFrame) -> pl.LazyFrame:
+    """
+    Lazy version of `tranform_processed_products_long`, the crop filter is applied to each product
+    slot before the slots are stacked.
+    """
+    db_columns = lf.columns
+    code_variables = [col for col in db_columns if "processed_product_code" in col or "transformed_product_code" in col]
+    name_variables = [col for col in db_columns if "processed_product_name" in col]
+
+    return pl.concat(
+        [
+            lf.select(
+                pl.col("household_id"),
+                pl.lit(name_col).alias("product"),
+                pl.col(name_col).alias("crop_name"),
+                pl.concat_str([pl.lit("0"), pl.col(code_col).cast(pl.Utf8)]).alias("crop_code")
+            )
+            .filter(pl.col("crop_name").str.to_lowercase().is_in(processed_crop_whitelist))
+            for name_col, code_col in zip(name_variables, code_variables)
+        ],
+        how="vertical"
+    )
+
+
+def run_cleaning_transformation_process_lazy(lf:pl.LazyFrame, **kwargs) -> Tuple[DataFrame, DataFrame]:
+    """
+    Lazy version of `run_cleaning_transformation_process`. Both outputs and the conversion checks
+    are collected together so the CSV is only scanned once, and returned as pandas DataFrames for `save_data_to_database`.
+    """
+    cleaned_lf = clean_variables_lazy(lf, **kwargs)
+    product_code_name_lf = tranform_processed_products_long_lazy(cleaned_lf)
+
+    # Binary and integer columns can not have missing values, `clean_variables` stores them as int64.
+    required_variables = list(kwargs["db_binary_variables"]) + list(kwargs["db_conv_int_variables"])
+    checked_variables = required_variables + list(kwargs["db_conv_float_variables"])
+    counts_lf = check_failed_conversions_lazy(cleaned_lf, checked_variables, required_variables)
+
+    product_variables = [col for col in cleaned_lf.columns if "processed_product" in col or "transformed_product_code" in col]
+    dropped_variables = product_variables + [f"{col}_failed" for col in checked_variables]
+    df, product_code_name, counts = pl.collect_all([cleaned_lf.drop(dropped_variables), product_code_name_lf, counts_lf])
+    raise_failed_conversions(counts, checked_variables, required_variables)
+
+    return pack_binary_answers(compact_dtypes(df.to_pandas())), product_code_name.to_pandas()
@@ -0,0 +1,112 @@
+from pandas import DataFrame, read_csv, concat
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Tuple
+import sys
+import duckdb
+
+from save_read_table import read_data_from_database
+
+# The forecasting code is shared with the dashboard.
+sys.path.append(str(Path(__file__).resolve().parent.parent / "dashboard"))
+from logic.func_rainfall_forecasting_process import (
+    clean_rainfall_data,
+    forecast_rainfall_monthly_quantity,
+    forecast_model_version
+)
+
+
+def forecast_department(task:Tuple[DataFrame, str, int]) -> DataFrame:
+    """
+    Forecast of a single department, run in a worker process by `forecast_all_departments`.
+    """
+    department_rainfall, department, n_future_period = task
+
+    forecast_dict = forecast_rainfall_monthly_quantity(department_rainfall, department, n_future_period=n_future_period)
+    if forecast_dict["error"]:
+        print(f"Unable to forecast the rainfall of {department}")
+        return DataFrame()
+
+    forecast, fct_df, _ = forecast_dict["values"]
+    return (
+        forecast[["ds", "yhat", "yhat_lower", "yhat_upper"]]
+        .assign(department=department, model_version=forecast_model_version(fct_df, department))
+    )
+
+
+def forecast_all_departments(rainfall_data:DataFrame, n_future_period:int=24, n_workers:int=None) -> DataFrame:
+    """
+    Forecast every department of the cleaned `rainfall_data` in a process pool, one department per task.
+    """
+    tasks = [
+        (department_rainfall, department, n_future_period)
+        for department, department_rainfall in rainfall_data.groupby("department", observed=True)
+    ]
+
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        forecasts = list(executor.map(forecast_department, tasks))
+
+    forecasts = [forecast for forecast in forecasts if forecast.shape[0] > 0]
+    if len(forecasts) == 0:
+        raise ValueError("No department could be forecasted")
+
+    return concat(forecasts, ignore_index=True)[
+        ["department", "ds", "yhat", "yhat_lower", "yhat_upper", "model_version"]
+    ]
+
+
+def save_rainfall_tables(
+        database_path:str,
+        rainfall_data:DataFrame,
+        rainfall_table_name:str="rainfall_qty"
+):
+    """
+    Replace the cleaned rainfall table in one transaction.
+    """
+    conn = duckdb.connect(database=database_path)
+    try:
+        conn.register("rainfall_frame", rainfall_data)
+        conn.execute("BEGIN TRANSACTION")
+        conn.execute(f"CREATE OR REPLACE TABLE {rainfall_table_name} AS SELECT * FROM rainfall_frame")
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+
+def run_rainfall_forecast(
+        database_path:str,
+        rainfall_path:str=None,
+        n_future_period:int=24,
+        n_workers:int=None,
+        rainfall_table_name:str="rainfall_qty",
+        forecast_table_name:str="rainfall_forecast"
+) -> int:
+    """
+    Precompute the rainfall forecast of every department into `forecast_table_name`.
+
+    With `rainfall_path` the raw rainfall file is cleaned with `clean_rainfall_data` and saved as
+    `rainfall_table_name` first. The forecasts are computed from the table as the dashboard
+    reads it, so their model version matches the one the dashboard checks.
+    """
+    if rainfall_path is not None:
+        rainfall_dict = clean_rainfall_data(read_csv(rainfall_path))
+        if rainfall_dict["error"]:
+            raise ValueError(f"Unable to clean the rainfall data in {rainfall_path}")
+        save_rainfall_tables(database_path, rainfall_dict["data"], rainfall_table_name)
+
+    rainfall_data = read_data_from_database(database_path, rainfall_table_name)
+    forecast = forecast_all_departments(rainfall_data, n_future_period, n_workers)
+
+    conn = duckdb.connect(database=database_path)
+    try:
+        conn.register("forecast_frame", forecast)
+        conn.execute("BEGIN TRANSACTION")
+        conn.execute(f"""
+            CREATE OR REPLACE TABLE {forecast_table_name} AS
+            SELECT *, current_timestamp AS created_at FROM forecast_frame
+        """)
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+    return forecast.shape[0]
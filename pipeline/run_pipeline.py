@@ -1,4 +1,10 @@
-from pandas import DataFrame
+from pandas import DataFrame, concat
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from glob import glob
+from os.path import isdir, join
+from typing import Dict, List, Tuple
 from data_import_clean import (
     db_select_columns,
     db_rename_columns,
@@ -8,48 +14,513 @@ from data_import_clean import (
     binary_qs_variables_name,
 
     read_select_variables,
-    run_cleaning_transformation_process
+    read_select_variables_chunked,
+    read_male_gender_code,
+    run_cleaning_transformation_process,
+    run_chunked_cleaning_transformation_process
 )
 
-from save_read_table import save_data_to_database
+from save_read_table import (
+    save_data_to_database,
+    upsert_data_to_database,
+    stage_data_to_database,
+    swap_staged_tables,
+    rebuild_department_kpis
+)
+from duckdb_ingest import ingest_csv_with_duckdb
+from polars_engine import read_select_variables_lazy, run_cleaning_transformation_process_lazy
+from pipeline_timing import new_timing_report, time_stage, write_timing_report
+from checkpoint import (
+    read_stage_config,
+    clean_stage_config,
+    file_content_hash,
+    stage_key,
+    load_checkpoint,
+    save_checkpoint,
+    is_already_loaded,
+    mark_as_loaded
+)
+import duckdb
+import polars as pl
+
 
+def save_cleaned_data(
+        database_path:str, 
+        db_cleaned:DataFrame, 
+        prod_code_name:DataFrame, 
+        load_mode:str="create",
+        source_name:str=None,
+        if_exists:str="fail",
+        kpi_table_name:str="department_kpis"
+):
+    """
+    Create the tables from scratch, or upsert only new and changed households when `load_mode` is "incremental".
+    The `kpi_table_name` table is refreshed with them, unless it is None.
+    """
+    if load_mode == "incremental":
+        load_summary = upsert_data_to_database(
+            database_path,
+            db_cleaned,
+            "irrigation",
+            prod_code_name,
+            "prod_code_name",
+            source_name=source_name,
+            kpi_table_name=kpi_table_name
+        )
+        print(load_summary)
+    else:
+        save_data_to_database(
+            database_path,
+            db_cleaned,
+            "irrigation",
+            prod_code_name,
+            "prod_code_name",
+            if_exists=if_exists,
+            kpi_table_name=kpi_table_name
+        )
 
-# Import data from source
-try:
-    db_data = read_select_variables("data/dummy.csv", db_select_columns, db_rename_columns, db_unique_departments)
-except ValueError as e:
-    print(e)
-    # Create empty dataframe
-    db_data = DataFrame()
 
-# Clean & Transform variable
-if db_data.shape[0] != 0: 
+def run_in_memory_pipeline(
+        file_path:str, 
+        database_path:str, 
+        quarantine_path:str=None, 
+        load_mode:str="create",
+        timing_report:Dict=None
+):
+    """ """
+    # Import data from source
     try:
-        db_cleaned, prod_code_name = run_cleaning_transformation_process(
-            db_data,
-            db_binary_variables=binary_qs_variables_name,
-            db_conv_int_variables=convert_to_int_variables,
-            db_conv_float_variables=convert_to_float_variables
-        )
+        with time_stage(timing_report, "read_select_variables") as stage:
+            read_report = {}
+            db_data = read_select_variables(
+                file_path, db_select_columns, db_rename_columns, db_unique_departments, quarantine_path, read_report
+            )
+            stage["rows_in"] = read_report["n_rows_read"]
+            stage["rows_out"] = db_data.shape[0]
     except ValueError as e:
         print(e)
-        db_cleaned = DataFrame()
-        prod_code_name = DataFrame()
+        # Create empty dataframe
+        db_data = DataFrame()
 
-    if db_cleaned.shape[0] != 0 and prod_code_name.shape[0] != 0:
+    # Clean & Transform variable
+    if db_data.shape[0] != 0:
         try:
-            save_data_to_database(
-                "db\dash_irrigation.duckdb", 
-                db_cleaned, 
+            db_cleaned, prod_code_name = run_cleaning_transformation_process(
+                db_data,
+                timing_report=timing_report,
+                db_binary_variables=binary_qs_variables_name,
+                db_conv_int_variables=convert_to_int_variables,
+                db_conv_float_variables=convert_to_float_variables
+            )
+        except ValueError as e:
+            print(e)
+            db_cleaned = DataFrame()
+            prod_code_name = DataFrame()
+
+        if db_cleaned.shape[0] != 0 and prod_code_name.shape[0] != 0:
+            try:
+                n_rows = db_cleaned.shape[0] + prod_code_name.shape[0]
+                with time_stage(timing_report, "save_data_to_database", rows_in=n_rows) as stage:
+                    save_cleaned_data(database_path, db_cleaned, prod_code_name, load_mode, file_path)
+                    stage["rows_out"] = n_rows
+            except (ValueError, duckdb.Error) as e:
+                print(e)
+
+
+def run_chunked_pipeline(
+        file_path:str, 
+        database_path:str, 
+        chunksize:int, 
+        quarantine_path:str=None, 
+        load_mode:str="create",
+        timing_report:Dict=None
+):
+    """
+    Read, clean and save `file_path` one chunk at a time so peak memory depends on
+    `chunksize` and not on the size of the file.
+
+    The chunks are loaded into the staging tables, which replace the live tables once the last
+    chunk is in, so readers never see a half-loaded file. Incremental loads upsert each chunk.
+    Either way the department KPIs are rebuilt once at the end instead of after every chunk.
+    """
+    # A chunk alone can not tell which integer gender code is male, it is picked from the whole file.
+    with time_stage(timing_report, "read_male_gender_code") as stage:
+        gender_read_report = {"n_rows_read": 0}
+        male_gender_code = read_male_gender_code(
+            [file_path], db_select_columns, db_rename_columns, db_unique_departments,
+            chunksize=chunksize, read_report=gender_read_report
+        )
+        stage["rows_in"] = gender_read_report["n_rows_read"]
+
+    chunk_read_report = {"n_rows_read": 0}
+    db_chunks = read_select_variables_chunked(
+        file_path, db_select_columns, db_rename_columns, db_unique_departments, 
+        chunksize=chunksize, quarantine_path=quarantine_path, read_report=chunk_read_report
+    )
+    cleaned_chunks = run_chunked_cleaning_transformation_process(
+        db_chunks,
+        db_binary_variables=binary_qs_variables_name,
+        db_conv_int_variables=convert_to_int_variables,
+        db_conv_float_variables=convert_to_float_variables,
+        male_gender_code=male_gender_code
+    )
+
+    n_saved_chunks = 0
+    try:
+        # Chunks are read, cleaned and saved in turn, so the whole run is a single stage.
+        with time_stage(timing_report, "chunked_pipeline") as stage:
+            stage["rows_out"] = 0
+            for chunk_number, (db_cleaned, prod_code_name) in enumerate(cleaned_chunks):
+                stage["rows_in"] = chunk_read_report["n_rows_read"]
+                if db_cleaned.shape[0] == 0 or prod_code_name.shape[1] == 0:
+                    print(f"Skipping chunk {chunk_number}: cleaning or transformation failed")
+                    continue
+
+                if load_mode == "incremental":
+                    save_cleaned_data(
+                        database_path, db_cleaned, prod_code_name, load_mode, file_path, kpi_table_name=None
+                    )
+                else:
+                    # The first saved chunk creates the staging tables, the rest are appended.
+                    stage_data_to_database(
+                        database_path, db_cleaned, "irrigation", prod_code_name, "prod_code_name",
+                        append_to_staging=n_saved_chunks > 0
+                    )
+                stage["rows_out"] += db_cleaned.shape[0]
+                n_saved_chunks += 1
+
+        # A failed chunk leaves the staged chunks unpublished.
+        if n_saved_chunks > 0 and load_mode != "incremental":
+            with time_stage(timing_report, "publish_chunked_load"):
+                swap_staged_tables(database_path, "irrigation", "prod_code_name", "department_kpis")
+    except (ValueError, duckdb.Error) as e:
+        print(e)
+    finally:
+        # Upserted chunks stay committed when a later chunk fails, the KPIs must follow them.
+        if n_saved_chunks > 0 and load_mode == "incremental":
+            try:
+                with time_stage(timing_report, "publish_chunked_load"):
+                    rebuild_department_kpis(database_path, "irrigation", "department_kpis")
+            except duckdb.Error as e:
+                print(e)
+
+
+def run_duckdb_pipeline(file_path:str, database_path:str, timing_report:Dict=None):
+    """
+    Read, clean and save `file_path` inside DuckDB without loading it into pandas.
+    """
+    try:
+        with time_stage(timing_report, "ingest_csv_with_duckdb") as stage:
+            n_rows, n_prod_rows = ingest_csv_with_duckdb(
+                database_path,
+                file_path,
                 "irrigation",
-                prod_code_name,
-                "prod_code_name"
+                "prod_code_name",
+                db_select_variables=db_select_columns,
+                db_rename_variables=db_rename_columns,
+                db_unq_departments=db_unique_departments,
+                db_binary_variables=binary_qs_variables_name,
+                db_conv_int_variables=convert_to_int_variables,
+                db_conv_float_variables=convert_to_float_variables,
+                kpi_table_name="department_kpis"
+            )
+            stage["rows_out"] = n_rows + n_prod_rows
+        print(f"Saved {n_rows} households and {n_prod_rows} processed products")
+    except (ValueError, duckdb.Error) as e:
+        print(e)
+
+
+def run_polars_pipeline(file_path:str, database_path:str, load_mode:str="create", timing_report:Dict=None):
+    """
+    Read, clean and transform `file_path` with the Polars lazy engine, then save it like the pandas engine.
+    """
+    try:
+        # The lazy query reads, cleans and transforms in one go, so it is a single stage.
+        with time_stage(timing_report, "polars_read_clean_transform") as stage:
+            db_cleaned, prod_code_name = run_cleaning_transformation_process_lazy(
+                read_select_variables_lazy(file_path, db_select_columns, db_rename_columns, db_unique_departments),
+                db_binary_variables=binary_qs_variables_name,
+                db_conv_int_variables=convert_to_int_variables,
+                db_conv_float_variables=convert_to_float_variables
+            )
+            stage["rows_out"] = db_cleaned.shape[0]
+    except (ValueError, pl.exceptions.PolarsError) as e:
+        print(e)
+        return
+
+    if db_cleaned.shape[0] != 0 and prod_code_name.shape[0] != 0:
+        try:
+            n_rows = db_cleaned.shape[0] + prod_code_name.shape[0]
+            with time_stage(timing_report, "save_data_to_database", rows_in=n_rows) as stage:
+                save_cleaned_data(database_path, db_cleaned, prod_code_name, load_mode, file_path)
+                stage["rows_out"] = n_rows
+        except (ValueError, duckdb.Error) as e:
+            print(e)
+
+def run_checkpointed_pipeline(
+        file_path:str, 
+        database_path:str, 
+        checkpoint_dir:str, 
+        quarantine_path:str=None, 
+        load_mode:str="create",
+        timing_report:Dict=None
+):
+    """
+    `run_in_memory_pipeline` with the output of each stage checkpointed to `checkpoint_dir`.
+    Checkpoints are keyed by the content of `file_path` and the cleaning configuration, so a
+    rerun starts at the first stage whose inputs changed and an unchanged file is not loaded again.
+    """
+    with time_stage(timing_report, "hash_input") as stage:
+        read_key = stage_key(file_content_hash(file_path), read_stage_config, quarantine_path=quarantine_path)
+        clean_key = stage_key(read_key, clean_stage_config)
+        load_key = stage_key(clean_key, [], load_mode=load_mode)
+
+    if is_already_loaded(checkpoint_dir, database_path, load_key):
+        print(f"{file_path} is unchanged since it was loaded into {database_path}, nothing to do")
+        return
+
+    # Clean & Transform variable, unless the cleaned data is checkpointed
+    cleaned = load_checkpoint(checkpoint_dir, "clean_transform", clean_key, ["db_cleaned", "prod_code_name"])
+    if cleaned is None:
+        # Import data from source, unless it is checkpointed
+        read = load_checkpoint(checkpoint_dir, "read_select_variables", read_key, ["db_data"])
+        if read is None:
+            try:
+                with time_stage(timing_report, "read_select_variables") as stage:
+                    read_report = {}
+                    db_data = read_select_variables(
+                        file_path, db_select_columns, db_rename_columns, db_unique_departments, quarantine_path, read_report
+                    )
+                    stage["rows_in"] = read_report["n_rows_read"]
+                    stage["rows_out"] = db_data.shape[0]
+            except ValueError as e:
+                print(e)
+                return
+            if db_data.shape[0] == 0:
+                return
+            save_checkpoint(checkpoint_dir, "read_select_variables", read_key, {"db_data": db_data})
+        else:
+            db_data = read["db_data"]
+
+        try:
+            db_cleaned, prod_code_name = run_cleaning_transformation_process(
+                db_data,
+                timing_report=timing_report,
+                db_binary_variables=binary_qs_variables_name,
+                db_conv_int_variables=convert_to_int_variables,
+                db_conv_float_variables=convert_to_float_variables
             )
         except ValueError as e:
             print(e)
+            return
+        if db_cleaned.shape[0] == 0 or prod_code_name.shape[0] == 0:
+            return
+        save_checkpoint(
+            checkpoint_dir, "clean_transform", clean_key, 
+            {"db_cleaned": db_cleaned, "prod_code_name": prod_code_name}
+        )
+    else:
+        db_cleaned, prod_code_name = cleaned["db_cleaned"], cleaned["prod_code_name"]
+
+    try:
+        n_rows = db_cleaned.shape[0] + prod_code_name.shape[0]
+        with time_stage(timing_report, "save_data_to_database", rows_in=n_rows) as stage:
+            save_cleaned_data(database_path, db_cleaned, prod_code_name, load_mode, file_path)
+            stage["rows_out"] = n_rows
+        mark_as_loaded(checkpoint_dir, database_path, load_key)
+    except (ValueError, duckdb.Error) as e:
+        print(e)
+
+
+def survey_file_paths(input_path:str) -> List[str]:
+    """
+    CSV files in the `input_path` directory, or matching the `input_path` glob.
+    """
+    if isdir(input_path):
+        return sorted(glob(join(input_path, "*.csv")))
+    return sorted(glob(input_path))
+
+
+def clean_survey_file(file_path:str, male_gender_code:int=None) -> Tuple[str, DataFrame, DataFrame]:
+    """
+    Read, clean and transform a single survey file, run in a worker process by `run_multi_file_pipeline`.
+    """
+    try:
+        db_data = read_select_variables(file_path, db_select_columns, db_rename_columns, db_unique_departments)
+        if db_data.shape[0] == 0:
+            return file_path, DataFrame(), DataFrame()
+
+        db_cleaned, prod_code_name = run_cleaning_transformation_process(
+            db_data,
+            db_binary_variables=binary_qs_variables_name,
+            db_conv_int_variables=convert_to_int_variables,
+            db_conv_float_variables=convert_to_float_variables,
+            male_gender_code=male_gender_code
+        )
+    except ValueError as e:
+        print(f"{file_path}: {e}")
+        return file_path, DataFrame(), DataFrame()
+
+    return file_path, db_cleaned, prod_code_name
+
+
+def run_multi_file_pipeline(
+        input_path:str, 
+        database_path:str, 
+        n_workers:int=None, 
+        load_mode:str="create",
+        timing_report:Dict=None
+):
+    """
+    Clean every survey file of `input_path` (a directory or a glob) in a process pool, one file
+    per task, then save all of them to the database in a single load.
+    """
+    file_paths = survey_file_paths(input_path)
+    if len(file_paths) == 0:
+        print(f"No CSV files found for {input_path}")
+        return
+
+    # A file alone can not tell which integer gender code is male, it is picked from all of them.
+    with time_stage(timing_report, "read_male_gender_code") as stage:
+        gender_read_report = {"n_rows_read": 0}
+        male_gender_code = read_male_gender_code(
+            file_paths, db_select_columns, db_rename_columns, db_unique_departments, read_report=gender_read_report
+        )
+        stage["rows_in"] = gender_read_report["n_rows_read"]
+
+    # Peak RSS is only sampled in this process, not in the workers.
+    with time_stage(timing_report, "clean_files_in_parallel", rows_in=len(file_paths)) as stage:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            cleaned_files = list(executor.map(clean_survey_file, file_paths, repeat(male_gender_code)))
+
+        cleaned_frames = []
+        prod_frames = []
+        for file_path, db_cleaned, prod_code_name in cleaned_files:
+            if db_cleaned.shape[0] == 0 or prod_code_name.shape[0] == 0:
+                print(f"Skipping {file_path}: cleaning or transformation failed")
+                continue
+            cleaned_frames.append(db_cleaned)
+            prod_frames.append(prod_code_name)
+        stage["rows_out"] = sum(db_cleaned.shape[0] for db_cleaned in cleaned_frames)
+
+    if len(cleaned_frames) == 0:
+        return
+
+    db_cleaned = concat(cleaned_frames, ignore_index=True)
+    prod_code_name = concat(prod_frames, ignore_index=True)
+    try:
+        n_rows = db_cleaned.shape[0] + prod_code_name.shape[0]
+        with time_stage(timing_report, "save_data_to_database", rows_in=n_rows) as stage:
+            save_cleaned_data(database_path, db_cleaned, prod_code_name, load_mode, input_path)
+            stage["rows_out"] = n_rows
+        print(f"Saved {db_cleaned.shape[0]} households from {len(cleaned_frames)} of {len(file_paths)} files")
+    except (ValueError, duckdb.Error) as e:
+        print(e)
+
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Import, clean and save the irrigation survey data.")
+    parser.add_argument("--file-path", default="data/dummy.csv")
+    parser.add_argument("--database-path", default="db\dash_irrigation.duckdb")
+    parser.add_argument(
+        "--engine", choices=["pandas", "polars", "duckdb"], default="pandas",
+        help="Clean the data with pandas, the Polars lazy engine or entirely inside DuckDB."
+    )
+    parser.add_argument(
+        "--chunksize", type=int, default=None,
+        help="Stream the file in chunks of this many rows instead of loading it in one shot."
+    )
+    parser.add_argument(
+        "--quarantine-path", default=None,
+        help="Save rows from unknown departments to this CSV file."
+    )
+    parser.add_argument(
+        "--load-mode", choices=["create", "incremental"], default="create",
+        help="Create the tables from scratch, or upsert only new and changed households. "
+             "The duckdb engine always creates the tables."
+    )
+    parser.add_argument(
+        "--input-glob", default=None,
+        help="Directory or glob of survey files (one per department and wave) to clean in parallel "
+             "and load together, instead of --file-path."
+    )
+    parser.add_argument(
+        "--n-workers", type=int, default=None,
+        help="Worker processes used with --input-glob, defaults to the number of CPUs."
+    )
+    parser.add_argument(
+        "--checkpoint-dir", default=None,
+        help="Checkpoint the output of each stage to this directory as Parquet, reruns skip the stages "
+             "whose input file and cleaning configuration did not change."
+    )
+    parser.add_argument(
+        "--forecast-rainfall", action="store_true",
+        help="Precompute the rainfall forecast of every department into the rainfall_forecast table."
+    )
+    parser.add_argument(
+        "--rainfall-path", default=None,
+        help="Raw rainfall CSV to clean into the rainfall_qty table before forecasting, "
+             "the existing rainfall_qty table is used otherwise."
+    )
+    parser.add_argument(
+        "--forecast-periods", type=int, default=24,
+        help="Number of months to forecast with --forecast-rainfall."
+    )
+    parser.add_argument(
+        "--timing-report", default=None,
+        help="Save the wall time, CPU time, peak RSS, rows and bytes written of each stage to this JSON file."
+    )
+    args = parser.parse_args()
 
+    # Checkpoints are only written by the in-memory pandas pipeline.
+    if args.checkpoint_dir is not None:
+        if args.input_glob is not None:
+            parser.error("--checkpoint-dir can not be used with --input-glob")
+        if args.engine != "pandas":
+            parser.error("--checkpoint-dir can only be used with --engine pandas")
+        if args.chunksize is not None:
+            parser.error("--checkpoint-dir can not be used with --chunksize, the checkpointed pipeline loads the whole file")
 
+    timing_report = None
+    if args.timing_report is not None:
+        timing_report = new_timing_report(
+            engine=args.engine,
+            file_path=args.file_path if args.input_glob is None else args.input_glob,
+            database_path=args.database_path,
+            chunksize=args.chunksize,
+            load_mode=args.load_mode
+        )
 
+    if args.input_glob is not None:
+        run_multi_file_pipeline(args.input_glob, args.database_path, args.n_workers, args.load_mode, timing_report)
+    elif args.engine == "duckdb":
+        run_duckdb_pipeline(args.file_path, args.database_path, timing_report)
+    elif args.engine == "polars":
+        run_polars_pipeline(args.file_path, args.database_path, args.load_mode, timing_report)
+    elif args.checkpoint_dir is not None:
+        run_checkpointed_pipeline(
+            args.file_path, args.database_path, args.checkpoint_dir, args.quarantine_path, args.load_mode, timing_report
+        )
+    elif args.chunksize is None:
+        run_in_memory_pipeline(args.file_path, args.database_path, args.quarantine_path, args.load_mode, timing_report)
+    else:
+        run_chunked_pipeline(
+            args.file_path, args.database_path, args.chunksize, args.quarantine_path, args.load_mode, timing_report
+        )
 
+    if args.forecast_rainfall:
+        # Imported here since the forecasting code pulls in Prophet.
+        from rainfall_forecast import run_rainfall_forecast
 
+        try:
+            with time_stage(timing_report, "forecast_rainfall") as stage:
+                stage["rows_out"] = run_rainfall_forecast(
+                    args.database_path, args.rainfall_path, args.forecast_periods, args.n_workers
+                )
+            print(f"Saved {stage['rows_out']} forecasted months")
+        except (ValueError, duckdb.Error) as e:
+            print(e)
 
+    if timing_report is not None:
+        write_timing_report(timing_report, args.timing_report)
@@ -1,37 +1,400 @@
-from pandas import DataFrame, read_sql
+from pandas import DataFrame, to_numeric
+from pandas.util import hash_pandas_object
+from typing import Dict, List
 import duckdb
 
+from data_import_clean import binary_answers_bits
+
 import warnings
 warnings.filterwarnings("ignore")
 
+def table_exists(conn:duckdb.DuckDBPyConnection, table_name:str) -> bool:
+    """ """
+    return conn.execute(
+        "SELECT count(*) > 0 FROM information_schema.tables WHERE table_name = ?", [table_name]
+    ).fetchone()[0]
+
+
+def binary_answers_mask_sql(alias:bool=True) -> str:
+    """
+    SQL version of `pack_binary_answers`.
+    """
+    bits = " | ".join(
+        f"(CASE WHEN {binary_variable} = 1 THEN {1 << bit} ELSE 0 END)"
+        for binary_variable, bit in binary_answers_bits.items()
+    )
+    return f"CAST({bits} AS UTINYINT)" + (" AS binary_answers_mask" if alias else "")
+
+
+def add_binary_answers_mask(conn:duckdb.DuckDBPyConnection, cleaned_data_table_name:str):
+    """ 
+    Add and backfill the `binary_answers_mask` column of a cleaned data table saved before it
+    existed, so new rows can be appended to it.
+    """
+    if not table_exists(conn, cleaned_data_table_name):
+        return
+
+    has_mask = conn.execute(
+        "SELECT count(*) > 0 FROM information_schema.columns WHERE table_name = ? AND column_name = 'binary_answers_mask'",
+        [cleaned_data_table_name]
+    ).fetchone()[0]
+    if not has_mask:
+        conn.execute(f"ALTER TABLE {cleaned_data_table_name} ADD COLUMN binary_answers_mask UTINYINT")
+        conn.execute(f"UPDATE {cleaned_data_table_name} SET binary_answers_mask = {binary_answers_mask_sql(alias=False)}")
+
+
+def department_kpis_sql(cleaned_data_table_name:str, filter_departments:bool=False) -> str:
+    """
+    Household count, average processed products, irrigation percentage and top water source of
+    each department, the values of the overview KPI cards. With `filter_departments` the query
+    takes the list of departments to compute as two parameters.
+    """
+    department_filter = "AND list_contains(?, department)" if filter_departments else ""
+
+    return f"""
+    WITH water AS (
+        SELECT
+            department,
+            source_of_irrigation_water_used AS top_water_source,
+            row_number() OVER (
+                PARTITION BY department ORDER BY count(*) DESC, source_of_irrigation_water_used
+            ) AS water_rank
+        FROM {cleaned_data_table_name}
+        WHERE source_of_irrigation_water_used != 'NA' {department_filter}
+        GROUP BY department, source_of_irrigation_water_used
+    ),
+    kpis AS (
+        SELECT
+            department,
+            count(DISTINCT household_id) AS household_count,
+            avg(number_of_products_processed) AS avg_processed_product,
+            100 * count(*) FILTER (WHERE irrigation_practice_on_household_farm = 1)
+                / count(irrigation_practice_on_household_farm) AS irrigation_percent
+        FROM {cleaned_data_table_name}
+        WHERE TRUE {department_filter}
+        GROUP BY department
+    )
+    SELECT kpis.*, water.top_water_source, current_timestamp AS refreshed_at
+    FROM kpis
+    LEFT JOIN water ON kpis.department = water.department AND water.water_rank = 1
+    """
+
+
+def refresh_department_kpis(
+        conn:duckdb.DuckDBPyConnection, 
+        cleaned_data_table_name:str, 
+        kpi_table_name:str, 
+        departments:List[str]=None
+):
+    """ 
+    Rebuild `kpi_table_name` from `cleaned_data_table_name`, or only the rows of `departments`
+    when given. Run it in the transaction that changes the cleaned data so both stay in sync.
+    """
+    if departments is None or not table_exists(conn, kpi_table_name):
+        conn.execute(f"CREATE OR REPLACE TABLE {kpi_table_name} AS {department_kpis_sql(cleaned_data_table_name)}")
+    else:
+        departments = [str(department) for department in departments]
+        conn.execute(f"DELETE FROM {kpi_table_name} WHERE list_contains(?, department)", [departments])
+        conn.execute(
+            f"INSERT INTO {kpi_table_name} {department_kpis_sql(cleaned_data_table_name, filter_departments=True)}",
+            [departments, departments]
+        )
+
+
 def save_data_to_database(
         new_database_path:str, 
         cleaned_data:DataFrame, 
         cleaned_data_table_name:str,
         prod_name_code:DataFrame,
         prod_name_code_table_name:str,
+        if_exists:str="fail",
+        kpi_table_name:str=None
 ):
-    """ """
+    """ 
+    The frames are registered with DuckDB, which scans them in place, and bulk loaded with
+    `CREATE TABLE AS` into staging tables. Both staging tables then replace the live tables in
+    one transaction, so readers never see a half-written table.
+
+    `if_exists` works like `DataFrame.to_sql`: "fail", "replace" or "append". Appends are
+    inserted straight into the live tables in a single transaction.
+
+    When `kpi_table_name` is given the department KPIs are refreshed in the same transaction,
+    only for the appended departments on appends.
+    """
+    tables = [(cleaned_data_table_name, cleaned_data), (prod_name_code_table_name, prod_name_code)]
+
     # Create new duckdb database
     conn = duckdb.connect(database=new_database_path) 
+    try:
+        if if_exists == "fail":
+            for table_name, _ in tables:
+                if table_exists(conn, table_name):
+                    raise ValueError(f"Table '{table_name}' already exists.")
 
-    # Move data into database
-    cleaned_data.to_sql(cleaned_data_table_name, conn, index=False)
-    prod_name_code.to_sql(prod_name_code_table_name, conn, index=False) 
+        # Move data into staging tables
+        staged_tables = []
+        for table_name, data in tables:
+            conn.register(f"{table_name}_frame", data)
+            if if_exists != "append" or not table_exists(conn, table_name):
+                conn.execute(f"CREATE OR REPLACE TABLE {table_name}_staging AS SELECT * FROM {table_name}_frame")
+                staged_tables.append(table_name)
 
-    # Close connection
-    conn.close()
+        # Swap the staging tables in
+        conn.execute("BEGIN TRANSACTION")
+        if cleaned_data_table_name not in staged_tables:
+            add_binary_answers_mask(conn, cleaned_data_table_name)
+        for table_name, _ in tables:
+            if table_name in staged_tables:
+                conn.execute(f"DROP TABLE IF EXISTS {table_name}")
+                conn.execute(f"ALTER TABLE {table_name}_staging RENAME TO {table_name}")
+            else:
+                conn.execute(f"INSERT INTO {table_name} BY NAME SELECT * FROM {table_name}_frame")
 
+        if kpi_table_name is not None:
+            changed_departments = None
+            if cleaned_data_table_name not in staged_tables:
+                changed_departments = cleaned_data["department"].unique()
+            refresh_department_kpis(conn, cleaned_data_table_name, kpi_table_name, changed_departments)
+        conn.execute("COMMIT")
 
+    finally:
+        # Close connection
+        conn.close()
 
-def read_data_from_database(database_path:str, table_name:str) -> DataFrame:
-    """ """
+
+def stage_data_to_database(
+        new_database_path:str, 
+        cleaned_data:DataFrame, 
+        cleaned_data_table_name:str,
+        prod_name_code:DataFrame,
+        prod_name_code_table_name:str,
+        if_exists:str="fail",
+        append_to_staging:bool=False
+):
+    """ 
+    First half of `save_data_to_database` for loads made of several frames, e.g. chunks: the
+    frames are loaded into the staging tables only, the live tables are untouched until
+    `swap_staged_tables`. With `append_to_staging` they are added to the staging tables of the
+    previous call.
+    """
+    tables = [(cleaned_data_table_name, cleaned_data), (prod_name_code_table_name, prod_name_code)]
+
+    conn = duckdb.connect(database=new_database_path) 
+    try:
+        if if_exists == "fail" and not append_to_staging:
+            for table_name, _ in tables:
+                if table_exists(conn, table_name):
+                    raise ValueError(f"Table '{table_name}' already exists.")
+
+        conn.execute("BEGIN TRANSACTION")
+        for table_name, data in tables:
+            conn.register(f"{table_name}_frame", data)
+            if append_to_staging:
+                conn.execute(f"INSERT INTO {table_name}_staging BY NAME SELECT * FROM {table_name}_frame")
+            else:
+                conn.execute(f"CREATE OR REPLACE TABLE {table_name}_staging AS SELECT * FROM {table_name}_frame")
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+
+def swap_staged_tables(
+        new_database_path:str, 
+        cleaned_data_table_name:str,
+        prod_name_code_table_name:str,
+        kpi_table_name:str=None
+):
+    """ 
+    Replace the live tables with the staging tables of `stage_data_to_database` in one
+    transaction, the department KPIs are rebuilt once in the same transaction.
+    """
+    conn = duckdb.connect(database=new_database_path) 
+    try:
+        conn.execute("BEGIN TRANSACTION")
+        for table_name in [cleaned_data_table_name, prod_name_code_table_name]:
+            conn.execute(f"DROP TABLE IF EXISTS {table_name}")
+            conn.execute(f"ALTER TABLE {table_name}_staging RENAME TO {table_name}")
+
+        if kpi_table_name is not None:
+            refresh_department_kpis(conn, cleaned_data_table_name, kpi_table_name)
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+
+def rebuild_department_kpis(database_path:str, cleaned_data_table_name:str, kpi_table_name:str):
+    """ 
+    Rebuild the whole `kpi_table_name`, once after loads that skipped the KPI refresh.
+    """
+    conn = duckdb.connect(database=database_path) 
+    try:
+        conn.execute("BEGIN TRANSACTION")
+        refresh_department_kpis(conn, cleaned_data_table_name, kpi_table_name)
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+
+def household_row_hashes(cleaned_data:DataFrame, prod_name_code:DataFrame) -> DataFrame:
+    """ 
+    One hash per household covering its cleaned row and all of its processed product rows.
+    The derived `binary_answers_mask` is left out, so adding it did not change any hash.
+    """
+    row_hash = hash_pandas_object(
+        cleaned_data.drop(columns=["binary_answers_mask"], errors="ignore"), index=False
+    ).to_numpy()
+    prod_hash = (
+        DataFrame({
+            "household_id": prod_name_code["household_id"].to_numpy(),
+            "prod_hash": hash_pandas_object(prod_name_code, index=False).to_numpy()
+        })
+        .groupby("household_id")["prod_hash"].sum()
+        .reindex(cleaned_data["household_id"], fill_value=0)
+        .to_numpy()
+    )
+
+    return DataFrame({
+        "household_id": cleaned_data["household_id"].to_numpy(),
+        "row_hash": row_hash ^ prod_hash.astype("uint64")
+    })
+
+
+def upsert_data_to_database(
+        database_path:str, 
+        cleaned_data:DataFrame, 
+        cleaned_data_table_name:str,
+        prod_name_code:DataFrame,
+        prod_name_code_table_name:str,
+        source_name:str=None,
+        load_state_table_name:str="load_state",
+        watermark_table_name:str="load_watermark",
+        kpi_table_name:str=None
+) -> Dict[str, int]:
+    """ 
+    Incremental alternative to `save_data_to_database` that upserts by `household_id`.
+
+    The hash of every household loaded so far is kept in `load_state_table_name`, so only new
+    or changed households are deleted and re-inserted in the data tables. Each load appends a
+    row to `watermark_table_name` with its time and counts, which are also returned. When
+    `kpi_table_name` is given the KPIs of the departments these households belong (or belonged)
+    to are refreshed.
+    """
+    cleaned_data = cleaned_data.drop_duplicates("household_id", keep="last")
+    incoming_hashes = household_row_hashes(cleaned_data, prod_name_code)
+
+    conn = duckdb.connect(database=database_path)
+    try:
+        conn.execute("BEGIN TRANSACTION")
+        add_binary_answers_mask(conn, cleaned_data_table_name)
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {load_state_table_name} (
+                household_id VARCHAR PRIMARY KEY, row_hash UBIGINT, loaded_at TIMESTAMP
+            )
+        """)
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {watermark_table_name} (
+                loaded_at TIMESTAMP, source_name VARCHAR, n_households BIGINT, n_inserted BIGINT, n_updated BIGINT
+            )
+        """)
+
+        conn.register("incoming_hashes", incoming_hashes)
+        # The state is filtered to the incoming households first, it grows with every load.
+        delta = conn.execute(f"""
+            SELECT incoming.household_id, incoming.row_hash, state.household_id IS NOT NULL AS is_update
+            FROM incoming_hashes AS incoming
+            LEFT JOIN (
+                SELECT household_id, row_hash FROM {load_state_table_name}
+                WHERE household_id IN (SELECT household_id FROM incoming_hashes)
+            ) AS state ON incoming.household_id = state.household_id
+            WHERE state.household_id IS NULL OR state.row_hash != incoming.row_hash
+        """).df()
+
+        n_updated = int(delta["is_update"].sum())
+        load_summary = {
+            "n_households": cleaned_data.shape[0],
+            "n_inserted": delta.shape[0] - n_updated,
+            "n_updated": n_updated,
+            "n_unchanged": cleaned_data.shape[0] - delta.shape[0]
+        }
+
+        if delta.shape[0] > 0:
+            conn.register("delta_households", delta)
+            conn.register("delta_cleaned", cleaned_data.loc[cleaned_data["household_id"].isin(delta["household_id"])])
+            conn.register("delta_prod", prod_name_code.loc[prod_name_code["household_id"].isin(delta["household_id"])])
+
+            # Rows of the delta households already loaded, found with a single semi-join. The
+            # state is not enough, tables created by `save_data_to_database` have no state.
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {cleaned_data_table_name} AS SELECT * FROM delta_cleaned LIMIT 0")
+            conn.execute(f"""
+                CREATE OR REPLACE TEMP TABLE existing_households AS
+                SELECT household_id, department FROM {cleaned_data_table_name}
+                WHERE household_id IN (SELECT household_id FROM delta_households)
+            """)
+            n_existing = conn.execute("SELECT count(*) FROM existing_households").fetchone()[0]
+
+            # Households can move department, so the departments they are leaving change too.
+            changed_departments = set(cleaned_data.loc[cleaned_data["household_id"].isin(delta["household_id"]), "department"])
+            changed_departments.update(department for department, in conn.execute(
+                "SELECT DISTINCT department FROM existing_households"
+            ).fetchall())
+
+            for table_name, delta_table in [
+                (cleaned_data_table_name, "delta_cleaned"), (prod_name_code_table_name, "delta_prod")
+            ]:
+                conn.execute(f"CREATE TABLE IF NOT EXISTS {table_name} AS SELECT * FROM {delta_table} LIMIT 0")
+                # New households have no rows to delete.
+                if n_existing > 0:
+                    conn.execute(f"""
+                        DELETE FROM {table_name} WHERE household_id IN (SELECT household_id FROM existing_households)
+                    """)
+                conn.execute(f"INSERT INTO {table_name} BY NAME SELECT * FROM {delta_table}")
+
+            conn.execute(f"""
+                INSERT OR REPLACE INTO {load_state_table_name}
+                SELECT household_id, row_hash, current_timestamp FROM delta_households
+            """)
+
+            if kpi_table_name is not None:
+                refresh_department_kpis(conn, cleaned_data_table_name, kpi_table_name, sorted(changed_departments))
+        elif kpi_table_name is not None and not table_exists(conn, kpi_table_name):
+            refresh_department_kpis(conn, cleaned_data_table_name, kpi_table_name)
+
+        conn.execute(
+            f"INSERT INTO {watermark_table_name} VALUES (current_timestamp, ?, ?, ?, ?)",
+            [source_name, load_summary["n_households"], load_summary["n_inserted"], load_summary["n_updated"]]
+        )
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+    return load_summary
+
+
+
+def narrow_dtypes(db_table:DataFrame, categorical_columns:List[str]=None) -> DataFrame:
+    """ 
+    Downcast integer columns to the smallest type that holds them and turn the
+    `categorical_columns` still stored as strings into categoricals.
+    """
+    for col in db_table.columns:
+        if db_table[col].dtype.kind in "iu":
+            db_table[col] = to_numeric(db_table[col], downcast="integer")
+        elif categorical_columns is not None and col in categorical_columns and db_table[col].dtype == "O":
+            db_table[col] = db_table[col].astype("category")
+
+    return db_table
+
+
+def read_data_from_database(database_path:str, table_name:str, categorical_columns:List[str]=None) -> DataFrame:
+    """ 
+    ENUM columns are loaded as categoricals and small integer columns keep their width.
+    """
     # Create a new connection to database
     new_conn = duckdb.connect(database=database_path) 
 
-    db_table = read_sql(f"SELECT * FROM {table_name}", new_conn)
+    db_table = new_conn.execute(f"SELECT * FROM {table_name}").df()
 
     # Close connection
     new_conn.close()
 
-    return db_table
\ No newline at end of file
+    return narrow_dtypes(db_table, categorical_columns)
\ No newline at end of file
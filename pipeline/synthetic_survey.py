@@ -0,0 +1,144 @@
+from pandas import DataFrame
+from numpy import ndarray, where, nonzero, array, clip
+from numpy.random import Generator, default_rng
+from argparse import ArgumentParser
+from typing import Dict
+
+from data_import_clean import (
+    db_select_columns,
+    db_rename_columns,
+    db_unique_departments,
+    convert_to_int_variables,
+    convert_to_float_variables,
+    binary_qs_variables_name
+)
+
+
+rename_variables = [str(col).strip().lower().replace(" ", "_") for col in db_rename_columns]
+
+# Share of households in each department, the dry north irrigates more than the coast.
+department_weights = [0.14, 0.12, 0.10, 0.07, 0.09, 0.08, 0.06, 0.07, 0.08, 0.06, 0.09, 0.04]
+
+# Crop names offered in each processed product slot and their survey codes, as in data/dummy.csv.
+product_slot_crops = [
+    {"Cotton": 20, "Maize": 12, "Rice": 15},
+    {"Yam": 31, "Mango": 39, "Cashew": 35},
+    {"Cocoa": 11, "Palm oil": 17, "Shea": 18},
+    {"Cassava": 40, "Sweet potato": 42, "Taro": 44}
+]
+water_sources = ["Well", "Dam", "River", "Borehole", None]
+water_source_weights = [0.35, 0.2, 0.15, 0.1, 0.2]
+
+# Share of string numerics written the way they come out of the survey tablets.
+messy_share = 0.05
+
+
+def messy_string_numerics(values:ndarray, rng:Generator, n_decimals:int=None) -> ndarray:
+    """
+    Numbers as survey strings, a `messy_share` of them with thousands separators, stray
+    punctuation or repeated decimal points that `clean_variables` has to strip.
+    """
+    if n_decimals is None:
+        strings = values.astype("str").astype("O")
+    else:
+        strings = values.round(n_decimals).astype("str").astype("O")
+
+    messy_rows = nonzero(rng.random(size=len(values)) < messy_share)[0]
+    noise_types = rng.integers(0, 3, size=len(messy_rows))
+    for row, noise_type in zip(messy_rows, noise_types):
+        value = strings[row]
+        if noise_type == 0 and n_decimals is None and len(value) > 3:
+            strings[row] = f"{value[:-3]},{value[-3:]}"
+        elif noise_type == 1 and "." in value:
+            strings[row] = value.replace(".", "..")
+        else:
+            strings[row] = f"{value}-" if n_decimals is None else f"{value}%"
+
+    return strings
+
+
+def messy_numeric_data(n_rows:int, seed:int=0) -> DataFrame:
+    """
+    Renamed string numeric columns of a synthetic survey, before `clean_variables`.
+    """
+    return synthetic_survey_data(n_rows, seed)[convert_to_int_variables + convert_to_float_variables]
+
+
+def synthetic_survey_chunk(n_rows:int, seed:int=0, first_household:int=0) -> DataFrame:
+    """
+    `n_rows` synthetic households with the raw `db_select_columns` names, numbered from
+    `first_household`. The same `seed` and `first_household` always give the same rows.
+    """
+    rng = default_rng([seed, first_household])
+    data = {}
+
+    departments = rng.choice(len(db_unique_departments), size=n_rows, p=department_weights)
+    data["department"] = [db_unique_departments[department] for department in departments]
+    data["household_id"] = [f"H{household:09d}" for household in range(first_household, first_household + n_rows)]
+    data["gender_of_head_of_household"] = where(rng.random(size=n_rows) < 0.72, "M", "F").astype("O")
+
+    # Binary questions are coded 1 = yes, 2 = no.
+    yes_rates = {"crop_production": 0.9, "processing_of_agricultural_products": 0.8}
+    for col in binary_qs_variables_name:
+        data[col] = where(rng.random(size=n_rows) < yes_rates.get(col, 0.6), 1, 2)
+
+    n_products = clip(rng.poisson(30, size=n_rows), 0, 120)
+    data["number_of_products_processed"] = messy_string_numerics(n_products, rng)
+
+    code_variables = [col for col in rename_variables if "processed_product_code" in col or "transformed_product_code" in col]
+    name_variables = [col for col in rename_variables if "processed_product_name" in col]
+    for name_col, code_col, crops in zip(name_variables, code_variables, product_slot_crops):
+        crop_names = list(crops)
+        crop_choice = rng.choice(len(crop_names), size=n_rows, p=[0.6, 0.25, 0.15])
+        data[name_col] = [crop_names[crop] for crop in crop_choice]
+        crop_codes = array([crops[crop] for crop in crop_names])
+        data[code_col] = messy_string_numerics(crop_codes[crop_choice], rng)
+
+    data["source_of_irrigation_water_used"] = rng.choice(water_sources, size=n_rows, p=water_source_weights)
+    data["number_of_roots_and_tubers_used"] = messy_string_numerics(clip(rng.poisson(22, size=n_rows), 0, 200), rng)
+
+    share_consumed = rng.beta(2, 6, size=n_rows)
+    data["share_of_roots_and_tubers_consumed"] = messy_string_numerics(share_consumed, rng, n_decimals=2)
+    data["share_of_roots_and_tubers_sold"] = messy_string_numerics(
+        clip(1 - share_consumed - rng.random(size=n_rows) * 0.1, 0, 1), rng, n_decimals=2
+    )
+
+    # Most households grow a few industrial crops, some grow thousands of plants.
+    data["number_of_industrial_crops_grown"] = messy_string_numerics(
+        rng.lognormal(3, 1.4, size=n_rows).astype("int64"), rng
+    )
+
+    return DataFrame({select_col: data[col] for select_col, col in zip(db_select_columns, rename_variables)})
+
+
+def synthetic_survey_data(n_rows:int, seed:int=0) -> DataFrame:
+    """
+    Renamed survey columns as returned by `read_select_variables`, before `clean_variables`.
+    """
+    return synthetic_survey_chunk(n_rows, seed).set_axis(rename_variables, axis=1)
+
+
+def write_synthetic_survey_csv(file_path:str, n_rows:int, seed:int=0, chunksize:int=500_000) -> Dict:
+    """
+    Save a synthetic survey of `n_rows` households to `file_path`. It is generated and written
+    `chunksize` rows at a time, so 10M households never have to fit in memory. The file only
+    depends on `n_rows`, `seed` and `chunksize`.
+    """
+    for first_household in range(0, n_rows, chunksize):
+        synthetic_survey_chunk(
+            min(chunksize, n_rows - first_household), seed, first_household
+        ).to_csv(file_path, mode="w" if first_household == 0 else "a", header=first_household == 0, index=False)
+
+    return {"file_path": file_path, "n_rows": n_rows, "seed": seed}
+
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Generate a synthetic irrigation survey with the raw survey columns.")
+    parser.add_argument("--file-path", default="data/synthetic_survey.csv")
+    parser.add_argument("--n-rows", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunksize", type=int, default=500_000)
+    args = parser.parse_args()
+
+    print(write_synthetic_survey_csv(args.file_path, args.n_rows, args.seed, args.chunksize))